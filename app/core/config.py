@@ -15,9 +15,38 @@ class Settings(BaseSettings):
     # (Phase 2) Base directory for cloning public repositories
     CLONE_DIR: str = "/app/clones"
 
+    # (Phase 2) Seconds an existing clone is served without queuing a background fetch
+    REPO_FETCH_TTL: int = 60
+
     # (Phase 3) Redis URL for Celery message broker
     REDIS_URL: str = "redis://redis:6379/0"
 
+    # Connections per Redis pool (rate limiter and cache each have one) in every worker
+    REDIS_MAX_CONNECTIONS: int = 64
+
+    # (Phase 3) Tasks each Celery worker runs at once (threads in one process)
+    CELERY_WORKER_CONCURRENCY: int = 16
+
+    # (Phase 3) Image for bisect sandboxes; use an image with your test runner
+    # preinstalled (ideally pinned by digest) if tests need more than git and sh
+    SANDBOX_IMAGE: str = "alpine/git:latest"
+
+    # (Phase 3) Fresh bisect sandbox containers each worker process keeps started ahead of time
+    SANDBOX_POOL_SIZE: int = 4
+    # Seconds a prewarmed sandbox container may wait for a bisect before it's removed
+    SANDBOX_IDLE_TTL: int = 600
+
+    # Feature flags, e.g. to run without limits locally or to bypass the response cache
+    ENABLE_RATE_LIMIT: bool = True
+    ENABLE_CACHE: bool = True
+
+    # On-disk cache for commit-addressed tool results (trees, diffs, repo maps)
+    RESULT_CACHE_DIR: str = os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "repo-mcp"
+    )
+    # Size cap for RESULT_CACHE_DIR in MB; least recently used entries are removed beyond it
+    RESULT_CACHE_MAX_MB: int = 1024
+
     # This line tells pydantic to load from a file named ".env"
     # and to not fail if it sees extra variables.
     model_config = SettingsConfigDict(env_file=".env", extra="ignore") # <--- Corrected usage
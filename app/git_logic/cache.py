@@ -0,0 +1,156 @@
+import os
+import json
+import hashlib
+import inspect
+import functools
+import tempfile
+import threading
+import time
+from ..core.config import settings
+from .repo_manager import get_repo_handle, resolve_commit
+
+# Load the cache directory from the app settings
+CACHE_DIR = settings.RESULT_CACHE_DIR
+CACHE_MAX_BYTES = settings.RESULT_CACHE_MAX_MB * 1024 * 1024
+
+# Seconds between size checks of the cache directory (each one lists every entry)
+_PRUNE_INTERVAL = 60
+# Pruning removes entries until the cache is this fraction of its cap, so it doesn't run on every write
+_PRUNE_TARGET = 0.9
+# Temp files older than this were left by a crashed writer
+_STALE_TMP_AGE = 3600
+_last_prune = 0.0
+_prune_lock = threading.Lock()
+
+def cached(fn):
+    """
+    Caches a tool function's result on disk as JSON.
+
+    The wrapped function must take `repo_path` and `commit_hash` arguments.
+    The commit is resolved to its full SHA before computing the key, so calls
+    for HEAD are stored under the concrete commit rather than "HEAD".
+    Commits are immutable, so entries never need invalidating; a missing file
+    is the only miss. Failed calls (returning None) are not cached.
+    Results are always returned as plain JSON data (pydantic models become dicts),
+    so a hit and a miss look the same to the caller.
+    """
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        repo_path = arguments.pop('repo_path')
+
+        try:
+            commit = resolve_commit(get_repo_handle(repo_path), arguments['commit_hash'])
+        except Exception:
+            # Let the tool function report the bad commit the way it normally does
+            return fn(*args, **kwargs)
+
+        arguments['commit_hash'] = commit.hexsha
+        key_material = repr((repo_path, commit.hexsha, fn.__name__, sorted(arguments.items())))
+        key = hashlib.blake2b(key_material.encode('utf-8'), digest_size=16).hexdigest()
+        cache_file = os.path.join(CACHE_DIR, f"{key}.json")
+
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            os.utime(cache_file) # Recently used entries survive pruning
+            return result
+        except (OSError, ValueError):
+            pass # Missing or unreadable entry, compute it
+
+        result = fn(repo_path, **arguments)
+        if result is None:
+            return result
+        try:
+            payload = json.dumps(result, default=_to_json)
+        except (TypeError, ValueError) as e:
+            print(f"Warning: Could not cache result of {fn.__name__}: {e}")
+            return result
+        _store(cache_file, payload)
+        return json.loads(payload)
+
+    return wrapper
+
+def _store(cache_file: str, payload: str) -> None:
+    """
+    Internal helper that writes a cache entry atomically (temp file + rename),
+    so concurrent readers never see a half-written file.
+    """
+    tmp_path = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_path, cache_file)
+        tmp_path = None
+    except OSError as e:
+        print(f"Warning: Could not write result cache entry {cache_file}: {e}")
+    finally:
+        if tmp_path is not None:
+            _unlink(tmp_path) # The write failed halfway, don't leave the temp file behind
+    _maybe_prune()
+
+def _maybe_prune() -> None:
+    """
+    Internal helper that runs _prune at most once per _PRUNE_INTERVAL per process.
+    """
+    global _last_prune
+    now = time.monotonic()
+    with _prune_lock:
+        if now - _last_prune < _PRUNE_INTERVAL:
+            return
+        _last_prune = now
+    _prune()
+
+def _prune() -> None:
+    """
+    Internal helper that keeps the cache directory under CACHE_MAX_BYTES.
+    Entries are removed least recently used first (reads touch the file's mtime),
+    down to _PRUNE_TARGET of the cap. Leftover temp files are removed as well.
+    """
+    entries = []
+    total = 0
+    now = time.time()
+    try:
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue # Removed by another process meanwhile
+                if entry.name.endswith('.tmp'):
+                    if now - st.st_mtime > _STALE_TMP_AGE:
+                        _unlink(entry.path)
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+    except OSError as e:
+        print(f"Warning: Could not scan result cache {CACHE_DIR}: {e}")
+        return
+        
+    if total <= CACHE_MAX_BYTES:
+        return
+    entries.sort()
+    target = CACHE_MAX_BYTES * _PRUNE_TARGET
+    for _mtime, size, path in entries:
+        if total <= target:
+            break
+        _unlink(path)
+        total -= size
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+def _to_json(obj):
+    # Tool results contain pydantic models (TreeItem, DiffStats, ...)
+    if not hasattr(obj, 'model_dump'):
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return obj.model_dump(mode='json')
@@ -1,9 +1,26 @@
+import atexit
 import os
 import shutil
+import stat
 import hashlib
-from git import Repo, GitCommandError
+import re
+import subprocess
+import threading
+import time
+from git import Repo, Commit, GitCommandError
+from git.util import hex_to_bin
+from collections import OrderedDict
+from typing import Iterator, Optional
 from ..core.config import settings
 from ..security import validation
+from ..tasks.celery_app import celery_app
+
+# pygit2 (libgit2) is optional. Without it the tools fall back to GitPython
+# and git plumbing commands.
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
 
 # Load the clone directory from the app settings
 CLONE_DIR = settings.CLONE_DIR
@@ -15,6 +32,110 @@ if not os.path.exists(CLONE_DIR):
     except OSError as e:
         print(f"Warning: Could not create CLONE_DIR at {CLONE_DIR}: {e}")
 
+# When each clone last had a background fetch queued, see _schedule_fetch
+_fetch_scheduled_at: dict[str, float] = {}
+
+# Only full SHAs are immutable; branch names and short hashes must be re-resolved
+_FULL_SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+
+# Full SHAs that resolve_commit has seen exist, keyed by (git dir, HEAD mtime, SHA) (LRU)
+_KNOWN_COMMITS_SIZE = 4096
+_known_commits: "OrderedDict[tuple, None]" = OrderedDict()
+_known_commits_lock = threading.Lock()
+
+# Handles are kept per thread, GitPython's persistent `git cat-file` pipes aren't thread-safe.
+# Each thread keeps its most recently used repos; a pool thread serves a few repos
+# at a time, so this bounds the cache by the pool size instead of a global limit
+# that a full pool would churn through.
+_HANDLES_PER_THREAD = 8
+_thread_handles = threading.local()
+
+def _get_thread_handle(kind: str, repo_path: str, open_handle, close_handle=None):
+    """
+    Internal helper that returns this thread's cached handle of the given kind for repo_path.
+    The mtime of .git/HEAD is checked on every call, so a re-cloned repo gets a fresh handle.
+    Evicted and stale handles are closed right away; only their own thread uses them.
+    """
+    head_mtime = os.path.getmtime(os.path.join(repo_path, '.git', 'HEAD'))
+    handles = _thread_handles.__dict__.setdefault(kind, OrderedDict())
+    
+    cached = handles.pop(repo_path, None)
+    if cached is not None and cached[0] == head_mtime:
+        handles[repo_path] = cached
+        return cached[1]
+        
+    stale = [cached[1]] if cached is not None else []
+    handle = open_handle(repo_path)
+    handles[repo_path] = (head_mtime, handle)
+    while len(handles) > _HANDLES_PER_THREAD:
+        stale.append(handles.popitem(last=False)[1][1])
+    if close_handle is not None:
+        for old in stale:
+            close_handle(old)
+    return handle
+
+def get_repo_handle(repo_path: str) -> Repo:
+    """
+    Returns a shared Repo handle for repo_path instead of constructing a new one per call.
+    Handles are per thread, see _get_thread_handle.
+    """
+    return _get_thread_handle('git', repo_path, Repo, Repo.close)
+
+def get_pygit2_handle(repo_path: str) -> Optional["pygit2.Repository"]:
+    """
+    Returns a shared in-process libgit2 handle for repo_path, cached like get_repo_handle.
+    Returns None if pygit2 isn't installed, callers then use the GitPython code path.
+    
+    libgit2 can't fetch from a promisor remote, so on partial clones callers must
+    download missing blobs with fetch_blobs before reading them.
+    """
+    if pygit2 is None:
+        return None
+    return _get_thread_handle('pygit2', repo_path, pygit2.Repository, pygit2.Repository.free)
+
+def is_full_sha(commit_hash: Optional[str]) -> bool:
+    """
+    Returns True if commit_hash is a full SHA, which always names the same commit.
+    HEAD, branches and short hashes can move.
+    """
+    return bool(commit_hash) and _FULL_SHA_RE.match(commit_hash) is not None
+
+def resolve_commit(repo: Repo, commit_hash: Optional[str] = None) -> Commit:
+    """
+    Resolves commit_hash (or HEAD when None) to a Commit object on the given handle.
+    Full SHAs already known to exist skip the object lookup.
+    """
+    if commit_hash is None:
+        return repo.head.commit
+    if not is_full_sha(commit_hash):
+        return repo.commit(commit_hash)
+        
+    # Only the SHA is remembered, the Commit is always built on the caller's own handle.
+    # HEAD's mtime is part of the key, so a re-cloned repo checks its commits again.
+    key = (repo.git_dir, os.path.getmtime(os.path.join(repo.git_dir, 'HEAD')), commit_hash)
+    with _known_commits_lock:
+        known = key in _known_commits
+        if known:
+            _known_commits.move_to_end(key)
+    if not known:
+        repo.commit(commit_hash) # Raises if the commit doesn't exist
+        with _known_commits_lock:
+            _known_commits[key] = None
+            while len(_known_commits) > _KNOWN_COMMITS_SIZE:
+                _known_commits.popitem(last=False)
+    return Commit(repo, hex_to_bin(commit_hash))
+
+def resolve_commit_sha(repo_path: str, commit_hash: Optional[str] = None) -> Optional[str]:
+    """
+    Resolves commit_hash (or HEAD when None) to its full SHA.
+    Returns None if it doesn't name a commit in the repo.
+    """
+    try:
+        return resolve_commit(get_repo_handle(repo_path), commit_hash).hexsha
+    except Exception as e:
+        print(f"Error resolving commit {commit_hash or 'HEAD'} in {repo_path}: {e}")
+        return None
+
 def get_repo(repo_url: str) -> str:
     """
     Clones or fetches a public repo and returns its local path.
@@ -32,56 +153,137 @@ def get_repo(repo_url: str) -> str:
     
     # 2. Create a unique, safe directory name from the URL hash
     # This prevents directory traversal (e.g., ../../) and gives a stable path for caching.
-    repo_hash = hashlib.md5(repo_url.encode()).hexdigest()
+    # BLAKE2b is faster than MD5 and truncating to 16 bytes keeps the 32-char directory names.
+    repo_hash = hashlib.blake2b(repo_url.encode('utf-8'), digest_size=16).hexdigest()
     repo_path = os.path.join(CLONE_DIR, repo_hash)
     
-    # 3. Check if repo is already cloned and valid
-    if os.path.exists(repo_path) and os.path.isdir(os.path.join(repo_path, '.git')):
-        try:
-            print(f"Fetching existing repo: {repo_url}")
-            repo = Repo(repo_path)
-            
-            # Ensure the remote URL matches the request (handling potential hash collisions or URL updates)
-            if repo.remotes.origin.url != repo_url:
-                print(f"Updating remote URL for {repo_path}")
-                repo.remotes.origin.set_url(repo_url)
-            
-            # Fetch latest changes
-            repo.remotes.origin.fetch()
-            
-        except GitCommandError as e:
-            print(f"Failed to fetch existing repo, attempting complete re-clone: {e}")
-            # If fetch fails (e.g., repo history changed), delete and re-clone
-            try:
-                shutil.rmtree(repo_path)
-            except OSError as cleanup_error:
-                 raise RuntimeError(f"Failed to clean up corrupted repo at {repo_path}: {cleanup_error}")
-            
-            return _clone_repo(repo_url, repo_path)
-            
-        except Exception as e:
-            raise RuntimeError(f"An unexpected error occurred during fetch: {e}")
+    # 3. Check if repo is already cloned and valid (one stat call on the hot path)
+    try:
+        is_cloned = stat.S_ISDIR(os.stat(os.path.join(repo_path, '.git')).st_mode)
+    except OSError:
+        is_cloned = False
+        
+    if is_cloned:
+        # Serve the existing clone right away; if it's stale, refresh it in the background
+        if not _fetched_recently(repo_path):
+            _schedule_fetch(repo_url, repo_path)
     else:
+        # Clones made before the switch from MD5 are moved over instead of re-cloned
+        if _adopt_legacy_clone(repo_url, repo_path):
+            return get_repo(repo_url)
+            
         # Repo doesn't exist or is corrupted (missing .git), clone it
-        if os.path.exists(repo_path):
-            try:
-                shutil.rmtree(repo_path)
-            except OSError:
-                pass # If we can't delete it, clone might fail below, which is caught
+        try:
+            shutil.rmtree(repo_path)
+        except FileNotFoundError:
+            pass # Nothing to clean up
+        except OSError:
+            pass # If we can't delete it, clone might fail below, which is caught
                 
         return _clone_repo(repo_url, repo_path)
     
     return repo_path
 
+def fetch_repo(repo_url: str, repo_path: str) -> str:
+    """
+    Fetches the latest changes into an existing clone.
+    Runs in the Celery worker (see git_tasks.fetch_repo_task), or inline if no broker is reachable.
+    
+    Args:
+        repo_url: The public HTTPS URL of the git repository.
+        repo_path: The local path of the existing clone.
+        
+    Returns:
+        The absolute local path to the (possibly re-cloned) repository.
+    """
+    try:
+        print(f"Fetching existing repo: {repo_url}")
+        repo = Repo(repo_path)
+        
+        # Ensure the remote URL matches the request (handling potential hash collisions or URL updates)
+        if repo.remotes.origin.url != repo_url:
+            print(f"Updating remote URL for {repo_path}")
+            repo.remotes.origin.set_url(repo_url)
+        
+        # Fetch latest changes, keeping the history as shallow as the clone
+        repo.remotes.origin.fetch(depth=50)
+        
+    except GitCommandError as e:
+        print(f"Failed to fetch existing repo, attempting complete re-clone: {e}")
+        # If fetch fails (e.g., repo history changed), delete and re-clone
+        try:
+            shutil.rmtree(repo_path)
+        except OSError as cleanup_error:
+             raise RuntimeError(f"Failed to clean up corrupted repo at {repo_path}: {cleanup_error}")
+        
+        return _clone_repo(repo_url, repo_path)
+        
+    except Exception as e:
+        raise RuntimeError(f"An unexpected error occurred during fetch: {e}")
+        
+    return repo_path
+
+def _fetched_recently(repo_path: str) -> bool:
+    """
+    Internal helper that checks whether the clone was fetched within REPO_FETCH_TTL.
+    git rewrites .git/FETCH_HEAD on every fetch; a fresh clone doesn't have one yet.
+    """
+    try:
+        fetched_at = os.path.getmtime(os.path.join(repo_path, '.git', 'FETCH_HEAD'))
+    except OSError:
+        fetched_at = 0
+    return time.time() - fetched_at < settings.REPO_FETCH_TTL
+
+def _schedule_fetch(repo_url: str, repo_path: str) -> None:
+    """
+    Internal helper that queues a background fetch on the Celery worker.
+    Requests arriving while a fetch is already queued don't queue another one.
+    If the broker is unreachable we fall back to fetching inline.
+    """
+    now = time.time()
+    if now - _fetch_scheduled_at.get(repo_path, 0) < settings.REPO_FETCH_TTL:
+        return
+    # Entries past the TTL no longer throttle anything, drop them so the dict stays small
+    for path, scheduled_at in list(_fetch_scheduled_at.items()):
+        if now - scheduled_at >= settings.REPO_FETCH_TTL:
+            _fetch_scheduled_at.pop(path, None)
+    _fetch_scheduled_at[repo_path] = now
+    
+    try:
+        celery_app.send_task('app.tasks.git_tasks.fetch_repo_task', args=[repo_url, repo_path], retry=False, ignore_result=True)
+    except Exception as e:
+        print(f"Could not queue background fetch, fetching inline: {e}")
+        fetch_repo(repo_url, repo_path)
+
+def _adopt_legacy_clone(repo_url: str, repo_path: str) -> bool:
+    """
+    Internal helper that renames a clone stored under the old MD5-based directory name
+    to its new path. Returns True if a clone was moved.
+    """
+    legacy_path = os.path.join(CLONE_DIR, hashlib.md5(repo_url.encode()).hexdigest())
+    if os.path.exists(repo_path) or not os.path.isdir(os.path.join(legacy_path, '.git')):
+        return False
+    try:
+        os.rename(legacy_path, repo_path)
+        return True
+    except OSError:
+        return False
+
 def _clone_repo(repo_url: str, repo_path: str) -> str:
     """
     Internal helper function to perform the initial clone.
     """
     try:
         print(f"Cloning new repo: {repo_url} to {repo_path}")
-        # We use a shallow clone (depth=50) to save disk space and time.
-        # We can fetch more history later if needed.
-        Repo.clone_from(repo_url, repo_path, depth=50)
+        # We use a shallow (depth=50), blobless partial clone to save disk space and time.
+        # File contents are fetched on demand from the promisor remote when first read,
+        # and git records the filter in the repo config so later fetches stay partial.
+        # No working tree is checked out, every tool reads straight from the object database.
+        Repo.clone_from(
+            repo_url,
+            repo_path,
+            multi_options=['--filter=blob:none', '--depth=50', '--no-tags', '--no-checkout']
+        )
         return repo_path
         
     except GitCommandError as e:
@@ -93,4 +295,209 @@ def _clone_repo(repo_url: str, repo_path: str) -> str:
     except Exception as e:
         if os.path.exists(repo_path):
             shutil.rmtree(repo_path, ignore_errors=True)
-        raise RuntimeError(f"An unexpected error occurred during clone: {e}")
\ No newline at end of file
+        raise RuntimeError(f"An unexpected error occurred during clone: {e}")
+
+def is_partial_clone(repo_path: str) -> bool:
+    """
+    Returns True if the repo was cloned with a filter, so blobs may be missing locally.
+    """
+    reader = get_repo_handle(repo_path).config_reader()
+    return bool(reader.get_value('remote "origin"', 'promisor', False))
+
+def prefetch_blobs(repo_path: str, revisions: list[str], only: Optional[list[str]] = None, depth: Optional[int] = None) -> None:
+    """
+    Downloads the file contents missing from a partial clone for the given revisions.
+    
+    Normal tool calls fetch blobs lazily, but the bisect sandbox runs with networking
+    disabled, so everything it may check out has to be present locally beforehand.
+    All missing blobs are requested in a single fetch.
+    
+    Args:
+        repo_path: The local path of the cloned repository.
+        revisions: Revisions whose blobs should be present, in `git rev-list` syntax
+            (history is walked unless `only` is set, ^<commit> excludes what that commit has).
+        only: Restrict the download to these blob ids, looking only at the revisions' own trees.
+        depth: Look only this deep into the revisions' own trees (1: just a tree's direct entries),
+            so listing one directory doesn't traverse the whole commit tree.
+    """
+    if not is_partial_clone(repo_path):
+        return
+        
+    repo = get_repo_handle(repo_path)
+    options = []
+    if only is not None:
+        if not only:
+            return
+        options.append('--no-walk')
+    if depth is not None:
+        options += ['--no-walk', f'--filter=tree:{depth}']
+        
+    missing = _missing_objects(repo, revisions, options)
+    if only is not None:
+        wanted = set(only)
+        missing = [oid for oid in missing if oid in wanted]
+    fetch_blobs(repo_path, missing)
+
+def prefetch_bisect_blobs(repo_path: str, bad_commit: str, good_commit: str) -> None:
+    """
+    Downloads the file contents a bisect between good_commit and bad_commit may check out:
+    the blobs new in good..bad, plus good_commit's own tree for the files the range didn't change.
+    Only those two walks are made, not the whole history reachable from both commits.
+    """
+    if not is_partial_clone(repo_path):
+        return
+        
+    repo = get_repo_handle(repo_path)
+    missing = _missing_objects(repo, [bad_commit, '^' + good_commit])
+    missing += _missing_objects(repo, [good_commit], ['--no-walk'])
+    fetch_blobs(repo_path, list(dict.fromkeys(missing)))
+
+def _missing_objects(repo: Repo, revisions: list[str], options: list[str] = ()) -> list[str]:
+    """
+    Internal helper that lists the objects reachable from revisions that the clone doesn't have.
+    Revisions come after --end-of-options, so a caller-supplied value like "--all" is
+    rejected as a bad revision instead of being parsed as an option.
+    """
+    listing = repo.git.rev_list('--objects', '--missing=print', *options, '--end-of-options', *revisions)
+    return [line[1:] for line in listing.splitlines() if line.startswith('?')]
+
+def fetch_blobs(repo_path: str, oids: list[str]) -> None:
+    """
+    Downloads the given blobs from the promisor remote in a single fetch.
+    The ids must be missing locally; git would re-download ones we already have.
+    """
+    if not oids:
+        return
+    
+    subprocess.run(
+        ['git', '-C', repo_path, '-c', 'fetch.negotiationAlgorithm=noop', 'fetch', 'origin',
+         '--no-tags', '--no-write-fetch-head', '--filter=blob:none', '--stdin'],
+        input="\n".join(oids).encode(),
+        check=True,
+        capture_output=True
+    )
+
+def iter_blob(repo_path: str, oid: str, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Streams a blob in chunks from its own `git cat-file blob` process, so a large
+    file is never held in memory (on a partial clone git downloads it first).
+    Closing the iterator early kills the process instead of reading the rest,
+    which the shared `--batch` pipe would have to do to stay in sync.
+    Raises KeyError if the blob doesn't exist.
+    """
+    proc = subprocess.Popen(
+        ['git', '-C', repo_path, 'cat-file', 'blob', oid],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        while True:
+            chunk = proc.stdout.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+        if proc.wait() != 0:
+            raise KeyError(oid)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+
+class _CatFileBatch:
+    """
+    A long-lived `git cat-file --batch` process for one repo.
+    The pipe carries one request at a time, so callers must hold `lock`.
+    """
+    def __init__(self, repo_path: str, head_mtime: float):
+        self.lock = threading.Lock()
+        self.head_mtime = head_mtime
+        self.proc = subprocess.Popen(
+            ['git', '-C', repo_path, 'cat-file', '--batch'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+        
+    def read(self, oid: str) -> Optional[bytes]:
+        self.proc.stdin.write(oid.encode() + b'\n')
+        self.proc.stdin.flush()
+        # Header is "<oid> <type> <size>" or "<oid> missing"
+        header = self.proc.stdout.readline().split()
+        if not header:
+            raise OSError("git cat-file exited unexpectedly")
+        if len(header) != 3:
+            return None
+        data = self.proc.stdout.read(int(header[2]))
+        self.proc.stdout.read(1) # Trailing newline after the content
+        return data
+        
+    def close(self) -> None:
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+
+# One cat-file process per recently used repo, evicted like the repo handles
+_CAT_FILE_LIMIT = 64
+_cat_file_batches: "OrderedDict[str, _CatFileBatch]" = OrderedDict()
+_cat_file_lock = threading.Lock()
+
+def read_blobs(repo_path: str, oids: list[str]) -> list[Optional[bytes]]:
+    """
+    Reads many objects through the repo's persistent `git cat-file --batch` process,
+    so process and object database startup is paid once instead of per call.
+    Returns the contents in the order of `oids`, None for ids git reports as missing.
+    A process that died is replaced once before giving up.
+    """
+    for attempt in range(2):
+        batch = _get_cat_file_batch(repo_path)
+        try:
+            with batch.lock:
+                return [batch.read(oid) for oid in oids]
+        except (OSError, ValueError):
+            _discard_cat_file_batch(repo_path, batch)
+            if attempt:
+                raise
+
+def read_blob(repo_path: str, oid: str) -> Optional[bytes]:
+    """
+    Reads a single object, see read_blobs.
+    """
+    return read_blobs(repo_path, [oid])[0]
+
+def _get_cat_file_batch(repo_path: str) -> _CatFileBatch:
+    # A re-cloned repo needs a new process, same as get_repo_handle
+    head_mtime = os.path.getmtime(os.path.join(repo_path, '.git', 'HEAD'))
+    evicted = []
+    with _cat_file_lock:
+        batch = _cat_file_batches.get(repo_path)
+        if batch is not None and batch.head_mtime == head_mtime:
+            _cat_file_batches.move_to_end(repo_path)
+            return batch
+        if batch is not None:
+            evicted.append(batch)
+        batch = _cat_file_batches[repo_path] = _CatFileBatch(repo_path, head_mtime)
+        _cat_file_batches.move_to_end(repo_path)
+        while len(_cat_file_batches) > _CAT_FILE_LIMIT:
+            evicted.append(_cat_file_batches.popitem(last=False)[1])
+            
+    # Wait for in-flight reads on the evicted processes before closing them
+    for old in evicted:
+        with old.lock:
+            old.close()
+    return batch
+
+def _discard_cat_file_batch(repo_path: str, batch: _CatFileBatch) -> None:
+    with _cat_file_lock:
+        if _cat_file_batches.get(repo_path) is batch:
+            del _cat_file_batches[repo_path]
+    batch.close()
+
+@atexit.register
+def _close_cat_file_batches() -> None:
+    with _cat_file_lock:
+        batches = list(_cat_file_batches.values())
+        _cat_file_batches.clear()
+    for batch in batches:
+        batch.close()
@@ -1,27 +1,72 @@
-from git import Repo, GitCommandError, Object, NULL_TREE 
+from git import Repo, GitCommandError, Object
 from ..schemas import CommitInfo, TreeItem, DiffStats, RepoMapItem
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Iterable, Iterator, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing
+from . import cache, repo_manager
+from .repo_manager import get_repo_handle, resolve_commit
+import codecs
+import multiprocessing
 import os
 import re
+import subprocess
+import threading
+
+# SHA of git's empty tree, used to diff the root commit
+EMPTY_TREE_SHA = "4b825dc642cb6eb9a060e54bf8d69288fbee4904"
+
+# Block size for streaming line ranges out of blobs
+_READ_CHUNK_SIZE = 64 * 1024
+# Local blobs up to this size are read in one go through libgit2 instead of streamed from git
+_IN_PROCESS_READ_LIMIT = 1024 * 1024
+
+# Repo maps with fewer files than this are scanned inline, the pool's IPC overhead isn't worth it
+_PARALLEL_MAP_THRESHOLD = 64
+_MAP_EXTENSIONS = ('.py', '.js', '.ts', '.java', '.cpp', '.cs')
+_MAP_MAX_FILE_SIZE = 100_000
+# Leading bytes checked for NUL to tell binary files apart (git checks 8000)
+_BINARY_SNIFF_SIZE = 8192
+
+# Blob listings of already walked trees, keyed by tree OID (LRU, shared by all repos)
+_SUBTREE_CACHE_SIZE = 10_000
+_SUBTREE_CACHE: "OrderedDict[pygit2.Oid, Tuple[Tuple[str, pygit2.Oid], ...]]" = OrderedDict()
+_SUBTREE_CACHE_LOCK = threading.Lock()
+_MAP_POOL: Optional[Executor] = None
+_MAP_POOL_LOCK = threading.Lock()
+
+# Definition patterns for the repo map, compiled once instead of per scanned file.
+# They match raw blob bytes so files are never decoded as a whole;
+# [\x80-\xff] keeps non-ASCII (UTF-8) identifiers matching like str patterns did.
+# Python: 'class MyClass:' or 'def my_func('
+_PY_DEF_RE = re.compile(rb'^[ \t]*(class\s+[\w\x80-\xff]+|def\s+[\w\x80-\xff]+)', re.MULTILINE)
+# JS/TS: 'function myFunc', 'class MyClass', 'const myFunc = () =>'
+_JS_DEF_RE = re.compile(rb'^[ \t]*(function\s+[\w\x80-\xff]+|class\s+[\w\x80-\xff]+|const\s+[\w\x80-\xff]+\s*=\s*(?:\(.*?\)|.*?)\s*=>)', re.MULTILINE)
 
 def get_history_for_file(repo_path: str, file_path: str) -> list[CommitInfo]:
     """
-    Uses GitPython to get the commit history for a specific file.
+    Gets the commit history for a specific file with a single `git log` call.
+    Fields and commits are split on the ASCII unit/record separators,
+    so commit messages can contain anything.
     """
     try:
-        repo = Repo(repo_path)
-        commits = list(repo.iter_commits(paths=file_path))
+        repo = get_repo_handle(repo_path)
+        output = repo.git.log('--format=%H%x1f%an%x1f%ae%x1f%cI%x1f%B%x1e', '--', file_path)
         
         history = []
-        for c in commits:
+        for record in output.split('\x1e'):
+            record = record.strip()
+            if not record:
+                continue
+            commit_hash, author_name, author_email, date_str, message = record.split('\x1f', 4)
             history.append(
-                CommitInfo(
-                    hash=c.hexsha,
-                    author_name=str(c.author.name),
-                    author_email=str(c.author.email),
-                    date=c.committed_datetime,
-                    message=c.message.strip()
+                CommitInfo.model_construct(
+                    hash=commit_hash,
+                    author_name=author_name,
+                    author_email=author_email,
+                    date=datetime.fromisoformat(date_str),
+                    message=message.strip()
                 )
             )
         return history
@@ -44,138 +89,391 @@ def get_file_content_at_commit(
     Supports slicing content by line numbers.
     """
     try:
-        repo = Repo(repo_path)
-        
-        if commit_hash is None:
-            commit = repo.head.commit
-        else:
-            commit = repo.commit(commit_hash)
-        
-        blob = commit.tree / file_path
-        content_data = blob.data_stream.read()
+        repo = get_repo_handle(repo_path)
         
-        # Decode content
-        decoded_content = content_data.decode('utf-8')
+        commit = resolve_commit(repo, commit_hash)
         
         # Handle Context Trimming (Line Slicing)
         if start_line is not None or end_line is not None:
-            lines = decoded_content.splitlines()
-            
             # Adjust 1-based start_line to 0-based index
             start_index = (start_line - 1) if (start_line and start_line > 0) else 0
             
-            # end_line is inclusive for humans, so we slice up to it
-            end_index = end_line if end_line else len(lines)
+            # end_line is inclusive for humans, so we slice up to it.
+            # A negative end_line counts from the end of the file, so we have to read it all.
+            end_index = end_line if (end_line and end_line > 0) else None
             
-            # Slice and rejoin
-            decoded_content = "\n".join(lines[start_index:end_index])
+            # Stream the blob up to the last requested line, then decode just that slice
+            oid = _blob_oid_at_commit(repo_path, commit, file_path)
+            with closing(_iter_blob(repo_path, oid)) as chunks:
+                content_data = _read_line_range(chunks, start_index, end_index)
+            if content_data is None:
+                return binary_file_content(file_path, commit.hexsha, _blob_size(repo_path, oid))
+            try:
+                # Lines end at '\n' only, the same boundaries _read_line_range counted
+                lines = _split_lines(content_data.decode('utf-8'))
+            except UnicodeDecodeError:
+                return binary_file_content(file_path, commit.hexsha, _blob_size(repo_path, oid))
+            if end_line and end_line < 0:
+                lines = lines[:end_line]
+                
+            # Rejoin
+            decoded_content = "\n".join(lines)
+            size_bytes = len(decoded_content.encode('utf-8')) # Return size of trimmed content
+        else:
+            content_data = _read_blob_at_commit(repo_path, commit, file_path)
+            size_bytes = len(content_data)
+            
+            # Decode content
+            if looks_binary(content_data):
+                return binary_file_content(file_path, commit.hexsha, size_bytes)
+            try:
+                decoded_content = content_data.decode('utf-8')
+            except UnicodeDecodeError:
+                return binary_file_content(file_path, commit.hexsha, size_bytes)
 
         return {
             "path": file_path,
             "content": decoded_content,
             "encoding": "utf-8",
             "commit_hash": commit.hexsha,
-            "size_bytes": len(decoded_content.encode('utf-8')) # Return size of trimmed content
+            "size_bytes": size_bytes
         }
     except (GitCommandError, KeyError, AttributeError) as e:
         print(f"Error getting file content: {e}")
         return None
-    except UnicodeDecodeError:
-        return {
-            "path": file_path,
-            "content": "[Binary file, content not displayable]",
-            "encoding": "binary",
-            "commit_hash": commit.hexsha,
-            "size_bytes": blob.size
-        }
     except ValueError as e:
         print(f"Commit not found (likely due to shallow clone): {e}")
         return None
 
+def get_file_size_at_commit(repo_path: str, file_path: str, commit_hash: Optional[str] = None) -> Optional[int]:
+    """
+    Returns the size in bytes of a file at a specific commit without reading its content,
+    or None if the file or commit doesn't exist.
+    """
+    try:
+        repo = get_repo_handle(repo_path)
+        commit = resolve_commit(repo, commit_hash)
+        return _blob_size(repo_path, _blob_oid_at_commit(repo_path, commit, file_path))
+    except (GitCommandError, KeyError, AttributeError, ValueError) as e:
+        print(f"Error getting file size: {e}")
+        return None
+
+def iter_file_at_commit(repo_path: str, file_path: str, commit_hash: Optional[str] = None) -> Optional[Iterator[bytes]]:
+    """
+    Returns an iterator over the raw bytes of a file at a specific commit, in chunks,
+    so large files are never held in memory. Returns None if the file or commit doesn't exist.
+    """
+    try:
+        repo = get_repo_handle(repo_path)
+        commit = resolve_commit(repo, commit_hash)
+        return _iter_blob(repo_path, _blob_oid_at_commit(repo_path, commit, file_path))
+    except (GitCommandError, KeyError, AttributeError, ValueError) as e:
+        print(f"Error reading file: {e}")
+        return None
+
+def is_text_file_at_commit(repo_path: str, file_path: str, commit_hash: Optional[str] = None) -> bool:
+    """
+    Returns True if a file at a specific commit is UTF-8 text (and not binary, see looks_binary),
+    checked chunk by chunk. Returns False for binary files and missing files or commits.
+    """
+    chunks = iter_file_at_commit(repo_path, file_path, commit_hash)
+    if chunks is None:
+        return False
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        with closing(chunks):
+            for index, chunk in enumerate(chunks):
+                if index == 0 and looks_binary(chunk):
+                    return False
+                decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+        return True
+    except UnicodeDecodeError:
+        return False
+    except KeyError as e:
+        print(f"Error reading file: {e}")
+        return False
+
+def _read_blob_at_commit(repo_path: str, commit, file_path: str) -> bytes:
+    """
+    Reads the blob at file_path in commit. Raises KeyError if there is none.
+    """
+    pg_repo = repo_manager.get_pygit2_handle(repo_path)
+    if pg_repo is not None:
+        # libgit2 reads the blob in-process instead of going through a git subprocess
+        entry = pg_repo[commit.hexsha].tree[file_path]
+        _ensure_blobs(repo_path, pg_repo, [entry.id])
+        return pg_repo[entry.id].data
+        
+    # Served by the repo's long-lived `git cat-file --batch` process
+    blob = commit.tree / file_path
+    data = repo_manager.read_blob(repo_path, blob.hexsha)
+    if data is None:
+        raise KeyError(file_path)
+    return data
+
+def _blob_oid_at_commit(repo_path: str, commit, file_path: str) -> str:
+    """
+    Returns the id of the blob at file_path in commit. Raises KeyError if there is none.
+    """
+    pg_repo = repo_manager.get_pygit2_handle(repo_path)
+    if pg_repo is not None:
+        entry = pg_repo[commit.hexsha].tree[file_path]
+        if entry.type_str != 'blob':
+            raise KeyError(file_path)
+        return str(entry.id)
+        
+    blob = commit.tree / file_path
+    if blob.type != 'blob':
+        raise KeyError(file_path)
+    return blob.hexsha
+
+def _iter_blob(repo_path: str, oid: str) -> Iterator[bytes]:
+    """
+    Yields a blob's content in chunks without holding large blobs in memory.
+    Small blobs that are already local are read in-process through libgit2,
+    everything else is streamed from git (see repo_manager.iter_blob).
+    """
+    pg_repo = repo_manager.get_pygit2_handle(repo_path)
+    if pg_repo is not None and oid in pg_repo.odb and pg_repo.odb.read_header(oid)[1] <= _IN_PROCESS_READ_LIMIT:
+        yield pg_repo[oid].data
+        return
+    yield from repo_manager.iter_blob(repo_path, oid, _READ_CHUNK_SIZE)
+
+def _blob_size(repo_path: str, oid: str) -> int:
+    """
+    Returns a blob's size from its object header, without reading its content.
+    """
+    pg_repo = repo_manager.get_pygit2_handle(repo_path)
+    if pg_repo is not None and oid in pg_repo.odb:
+        return pg_repo.odb.read_header(oid)[1]
+    # git downloads a partial clone's missing blob to answer
+    return int(get_repo_handle(repo_path).git.cat_file('-s', oid))
+
+def _ensure_blobs(repo_path: str, pg_repo, oids) -> None:
+    """
+    Downloads any of the given blobs that a partial clone doesn't have yet.
+    libgit2 can't fetch lazily like git does, it just reports the object as missing.
+    """
+    missing = [str(oid) for oid in oids if oid not in pg_repo.odb]
+    repo_manager.fetch_blobs(repo_path, missing)
+
+def binary_file_content(file_path: str, commit_hash: str, size: int) -> dict:
+    """
+    Returns the get_file_content_at_commit result for a binary (or non-UTF-8) file.
+    """
+    return {
+        "path": file_path,
+        "content": "[Binary file, content not displayable]",
+        "encoding": "binary",
+        "commit_hash": commit_hash,
+        "size_bytes": size
+    }
+
+def looks_binary(data: bytes) -> bool:
+    """
+    Returns True if data (a whole file or its first chunk) looks binary:
+    a NUL byte in the leading bytes, the same heuristic git uses.
+    """
+    return b'\0' in data[:_BINARY_SNIFF_SIZE]
+
+def _split_lines(text: str) -> List[str]:
+    # str.splitlines() also breaks on '\r', '\f', '\u2028', ..., which would shift line numbers
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop() # Text ending in a newline has no empty last line
+    return lines
+
+def _read_line_range(chunks: Iterable[bytes], start_index: int, end_index: Optional[int]) -> Optional[bytes]:
+    """
+    Reads lines [start_index, end_index) from a blob's chunks (see _iter_blob).
+    Chunks that end before start_index are skipped without splitting them,
+    and reading stops as soon as end_index lines have been seen.
+    
+    Returns None if the blob looks binary (see looks_binary), since the rest of
+    the file is never decoded to find out.
+    """
+    parts = []
+    line_index = 0 # Index of the line the next byte belongs to
+    first_chunk = True
+    for chunk in chunks:
+        if end_index is not None and line_index >= end_index:
+            break
+        if first_chunk:
+            if looks_binary(chunk):
+                return None
+            first_chunk = False
+            
+        newlines = chunk.count(b'\n')
+        if line_index + newlines < start_index:
+            line_index += newlines
+            continue
+            
+        pos = 0
+        while pos < len(chunk) and (end_index is None or line_index < end_index):
+            newline = chunk.find(b'\n', pos)
+            line_end = len(chunk) if newline == -1 else newline + 1
+            if line_index >= start_index:
+                parts.append(chunk[pos:line_end])
+            if newline == -1:
+                break # Line continues in the next chunk
+            line_index += 1
+            pos = line_end
+            
+    return b''.join(parts)
+
+@cache.cached
 def get_tree_at_commit(repo_path: str, path: Optional[str] = None, commit_hash: Optional[str] = None) -> Optional[dict]:
     """
     Uses GitPython to get the file/directory tree at a specific commit.
     """
     try:
-        repo = Repo(repo_path)
+        repo = get_repo_handle(repo_path)
         
-        if commit_hash is None:
-            commit = repo.head.commit
-        else:
-            commit = repo.commit(commit_hash)
+        commit = resolve_commit(repo, commit_hash)
         
-        if path:
-            tree_obj = commit.tree / path
+        pg_repo = repo_manager.get_pygit2_handle(repo_path)
+        if pg_repo is not None:
+            tree_items = _list_tree_pygit2(repo_path, pg_repo, commit.hexsha, path)
         else:
-            tree_obj = commit.tree
+            tree_items = _list_tree_git(repo, repo_path, commit.hexsha, path)
             
-        tree_items = []
-        for item in tree_obj.trees:
-            tree_items.append(TreeItem(
-                path=item.path,
-                type="tree",
-                size=item.size,
-                mode=f"{item.mode:o}"
-            ))
-        for item in tree_obj.blobs:
-             tree_items.append(TreeItem(
-                path=item.path,
-                type="blob",
-                size=item.size,
-                mode=f"{item.mode:o}"
-            ))
+        if tree_items is None:
+            return None
             
         return {
             "commit_hash": commit.hexsha,
             "path": path if path else "/",
             "tree": tree_items
         }
-    except (GitCommandError, KeyError, AttributeError) as e:
+    except (GitCommandError, subprocess.CalledProcessError, KeyError, AttributeError) as e:
         print(f"Error getting tree structure: {e}")
         return None
     except ValueError as e:
         print(f"Commit not found (likely due to shallow clone): {e}")
         return None
 
+def _list_tree_pygit2(repo_path: str, pg_repo, commit_sha: str, path: Optional[str]) -> Optional[List[TreeItem]]:
+    """
+    Lists a directory through libgit2. Sizes come from the object headers,
+    so blob contents are never inflated.
+    """
+    tree = pg_repo[commit_sha].tree
+    prefix = ''
+    if path:
+        prefix = path.strip('/') + '/'
+        try:
+            tree = pg_repo[tree[prefix.rstrip('/')].id]
+        except KeyError:
+            return None
+        if tree.type_str != 'tree':
+            return None
+            
+    # Same entry order and exclusions as `git ls-tree`
+    blob_entries = [entry for entry in tree if entry.type_str == 'blob']
+    _ensure_blobs(repo_path, pg_repo, [entry.id for entry in blob_entries])
+    
+    trees = [
+        TreeItem.model_construct(path=prefix + entry.name, type='tree', size=0, mode=f"{entry.filemode:o}")
+        for entry in tree if entry.type_str == 'tree'
+    ]
+    blobs = [
+        TreeItem.model_construct(
+            path=prefix + entry.name,
+            type='blob',
+            size=pg_repo.odb.read_header(entry.id)[1],
+            mode=f"{entry.filemode:o}"
+        )
+        for entry in blob_entries
+    ]
+    return trees + blobs
+
+def _list_tree_git(repo: Repo, repo_path: str, commit_sha: str, path: Optional[str]) -> Optional[List[TreeItem]]:
+    """
+    Lists a directory with `git ls-tree -l`.
+    """
+    ls_tree_args = ['-z', commit_sha]
+    if path:
+        ls_tree_args += ['--', path.rstrip('/') + '/']
+
+    # `ls-tree -l` needs every blob's size, which a blobless clone would fetch one at a time.
+    # Only the directory's own entries are checked, not the commit's whole tree.
+    if repo_manager.is_partial_clone(repo_path):
+        # "<commit>:<dir>" names the directory's tree ("<commit>:" the root tree)
+        tree_ish = f"{commit_sha}:{path.strip('/') if path else ''}"
+        repo_manager.prefetch_blobs(repo_path, [tree_ish], depth=1)
+
+    # One `git ls-tree` call instead of an object lookup per entry.
+    # Each entry is "<mode> <type> <oid> <size>\t<path>"; trees have '-' as size.
+    listing = repo.git.ls_tree('-l', *ls_tree_args)
+
+    trees = []
+    blobs = []
+    for entry in listing.split('\0'):
+        if not entry:
+            continue
+        meta, item_path = entry.split('\t', 1)
+        mode, obj_type, _oid, size = meta.split()
+        if obj_type == 'tree':
+            items = trees
+        elif obj_type == 'blob':
+            items = blobs
+        else:
+            continue # Submodules ('commit' entries) aren't listed
+        items.append(TreeItem.model_construct(
+            path=item_path,
+            type=obj_type,
+            size=int(size) if size != '-' else 0,
+            mode=mode.lstrip('0') or '0'
+        ))
+
+    # git prints nothing for a path that doesn't exist or isn't a directory
+    if path and not trees and not blobs:
+        return None
+    
+    return trees + blobs
+
+@cache.cached
 def get_diff_for_commit(repo_path: str, commit_hash: str) -> Optional[dict]:
     """
     Gets the diff (file changes) for a specific commit.
+    Diffs in-process through libgit2 when pygit2 is installed, otherwise with
+    `git diff-tree --raw --numstat` so git counts the lines for us
+    instead of decoding and scanning the whole patch in Python.
     """
     try:
-        repo = Repo(repo_path)
-        commit = repo.commit(commit_hash)
+        repo = get_repo_handle(repo_path)
+        commit = resolve_commit(repo, commit_hash)
         
         if not commit.parents:
-            parent = NULL_TREE 
+            # Diff the initial commit against the empty tree (what NULL_TREE resolves to)
+            parent_ref = EMPTY_TREE_SHA
             parent_hash = "0000000000000000000000000000000000000000"
         else:
-            parent = commit.parents[0]
-            parent_hash = parent.hexsha
+            parent_ref = commit.parents[0].hexsha
+            parent_hash = parent_ref
             
-        diffs = commit.diff(parent, create_patch=True)
+        pg_repo = repo_manager.get_pygit2_handle(repo_path)
+        if pg_repo is not None:
+            entries = _diff_entries_pygit2(repo_path, pg_repo, parent_ref, commit.hexsha)
+        else:
+            # -z keeps paths with spaces/newlines intact; -M turns delete+add pairs into renames
+            raw = repo.git.diff_tree('-r', '-M', '--raw', '--numstat', '-z', parent_ref, commit.hexsha)
+            entries = _parse_diff_tree(raw)
         
         changes = []
-        for d in diffs:
-            lines_added = 0
-            lines_deleted = 0
-            
-            if d.diff:
-                diff_text = d.diff.decode('utf-8', errors='replace')
-                for line in diff_text.splitlines():
-                    if line.startswith('+') and not line.startswith('+++'):
-                        lines_added += 1
-                    elif line.startswith('-') and not line.startswith('---'):
-                        lines_deleted += 1
-
-            stats = DiffStats(
-                file_path=d.a_path if d.a_path else d.b_path,
+        for status, old_path, new_path, lines_added, lines_deleted in entries:
+            is_renamed = status.startswith('R')
+            # Fields come straight from git's output, so pydantic validation is skipped
+            stats = DiffStats.model_construct(
+                file_path=new_path if new_path else old_path,
                 lines_added=lines_added,
                 lines_deleted=lines_deleted,
-                is_new=d.new_file,
-                is_deleted=d.deleted_file,
-                is_renamed=d.renamed_file,
-                rename_from=d.rename_from,
-                rename_to=d.rename_to
+                is_new=status == 'A',
+                is_deleted=status == 'D',
+                is_renamed=is_renamed,
+                rename_from=old_path if is_renamed else None,
+                rename_to=new_path if is_renamed else None
             )
             changes.append(stats)
             
@@ -188,74 +486,246 @@ def get_diff_for_commit(repo_path: str, commit_hash: str) -> Optional[dict]:
         print(f"Error getting commit diff: {e}")
         return None
 
+def _diff_entries_pygit2(repo_path: str, pg_repo, parent_ref: str, commit_sha: str) -> List[tuple]:
+    """
+    Diffs commit_sha against parent_ref through libgit2.
+    Returns the same tuples as _parse_diff_tree.
+    """
+    commit_tree = pg_repo[commit_sha].tree
+    if parent_ref == EMPTY_TREE_SHA:
+        diff = commit_tree.diff_to_tree(swap=True)
+    else:
+        diff = pg_repo[parent_ref].tree.diff_to_tree(commit_tree)
+        
+    # Rename detection and line counts read both sides of every change
+    # (mode 0 is the missing side of an add/delete, 160000 a submodule commit)
+    changed_oids = set()
+    for delta in diff.deltas:
+        changed_oids.update(f.id for f in (delta.old_file, delta.new_file) if f.mode not in (0, 0o160000))
+    _ensure_blobs(repo_path, pg_repo, changed_oids)
+    
+    # Same default similarity threshold (50%) as `git diff -M`
+    diff.find_similar()
+    
+    entries = []
+    for patch in diff:
+        delta = patch.delta
+        status = delta.status_char()
+        old_path = delta.old_file.path if status != 'A' else None
+        new_path = delta.new_file.path if status != 'D' else None
+        _context, lines_added, lines_deleted = patch.line_stats # Binary files count as 0
+        entries.append((status, old_path, new_path, lines_added, lines_deleted))
+    return entries
+
+def _parse_diff_tree(output: str) -> List[tuple]:
+    """
+    Parses `git diff-tree -r -M --raw --numstat -z` output.
+    Git prints every raw record first, then the numstat records in the same order,
+    so the two halves are zipped together.
+    
+    Returns:
+        A list of (status, old_path, new_path, lines_added, lines_deleted) tuples.
+        Binary files are reported by git as '-' and counted as 0 lines.
+    """
+    tokens = output.split('\0')
+    raw_entries = []
+    numstats = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if not token:
+            i += 1
+            continue
+            
+        if token.startswith(':'):
+            # ":<old mode> <new mode> <old sha> <new sha> <status>" followed by path(s)
+            status = token.split()[-1]
+            if status[0] in ('R', 'C'):
+                old_path, new_path = tokens[i + 1], tokens[i + 2]
+                i += 3
+            else:
+                old_path = new_path = tokens[i + 1]
+                if status == 'D':
+                    new_path = None
+                elif status == 'A':
+                    old_path = None
+                i += 2
+            raw_entries.append((status, old_path, new_path))
+        else:
+            # "<added>\t<deleted>\t<path>"; renames leave the path empty and
+            # put the old/new paths in the next two tokens
+            added, deleted, path = token.split('\t', 2)
+            i += 1 if path else 3
+            numstats.append((
+                int(added) if added != '-' else 0,
+                int(deleted) if deleted != '-' else 0
+            ))
+            
+    return [entry + stats for entry, stats in zip(raw_entries, numstats)]
+
+@cache.cached
 def generate_repo_map(repo_path: str, commit_hash: Optional[str] = None) -> Optional[dict]:
     """
     Generates a high-level map of the repository (classes, functions) using Regex.
+    Files are read in-process through libgit2 when pygit2 is installed,
+    otherwise through `git ls-tree` and a persistent `git cat-file --batch` process.
     """
     try:
-        repo = Repo(repo_path)
-        if commit_hash is None:
-            commit = repo.head.commit
-        else:
-            commit = repo.commit(commit_hash)
+        repo = get_repo_handle(repo_path)
+        commit = resolve_commit(repo, commit_hash)
             
-        repo_map = []
+        pg_repo = repo_manager.get_pygit2_handle(repo_path)
+        if pg_repo is not None:
+            files = _read_code_files_pygit2(repo_path, pg_repo, commit.hexsha)
+        else:
+            files = _read_code_files_git(repo, repo_path, commit.hexsha)
         
-        # Walk through the entire tree
-        for blob in commit.tree.traverse():
-            if blob.type != 'blob':
-                continue
-                
-            # Only analyze code files (basic heuristic)
-            if not blob.path.endswith(('.py', '.js', '.ts', '.java', '.cpp', '.cs')):
-                continue
+        # Regex extraction is pure CPU work on independent files, spread it across cores
+        if len(files) >= _PARALLEL_MAP_THRESHOLD:
+            results = _get_map_pool().map(_extract_definitions_worker, files, chunksize=32)
+        else:
+            results = map(_extract_definitions_worker, files)
             
-            # Limit: Skip massive files to avoid timeout
-            if blob.size > 100_000: 
-                continue
-
-            try:
-                content = blob.data_stream.read().decode('utf-8')
-                definitions = _extract_definitions(content, blob.path)
-                
-                if definitions:
-                    repo_map.append(RepoMapItem(
-                        file_path=blob.path,
-                        definitions=definitions
-                    ))
-            except UnicodeDecodeError:
-                continue # Skip binary or non-utf8 files
+        repo_map = []
+        for path, definitions in results:
+            if definitions:
+                repo_map.append(RepoMapItem.model_construct(
+                    file_path=path,
+                    definitions=definitions
+                ))
                 
         return {
             "commit_hash": commit.hexsha,
             "map": repo_map
         }
-    except (GitCommandError, ValueError) as e:
+    except (GitCommandError, subprocess.CalledProcessError, ValueError) as e:
         print(f"Error generating repo map: {e}")
         return None
 
-def _extract_definitions(content: str, file_path: str) -> List[str]:
+def _is_map_candidate(path: str) -> bool:
+    # Only analyze code files (basic heuristic)
+    return path.endswith(_MAP_EXTENSIONS)
+
+def _read_code_files_pygit2(repo_path: str, pg_repo, commit_sha: str) -> List[Tuple[str, bytes]]:
+    """
+    Collects (path, content) for every code file in the commit through libgit2.
+    """
+    code_files = [
+        (path, oid) for path, oid in _walk_tree_cached(pg_repo, pg_repo[commit_sha].tree)
+        if _is_map_candidate(path)
+    ]
+    _ensure_blobs(repo_path, pg_repo, [oid for _, oid in code_files])
+    
+    files = []
+    for path, oid in code_files:
+        # Limit: Skip massive files to avoid timeout
+        if pg_repo.odb.read_header(oid)[1] > _MAP_MAX_FILE_SIZE:
+            continue
+        files.append((path, pg_repo[oid].data))
+    return files
+
+def _walk_tree_cached(pg_repo, tree) -> Tuple[Tuple[str, "pygit2.Oid"], ...]:
+    """
+    Returns (path, oid) for every blob below tree, in `git ls-tree -r` order,
+    with paths relative to tree.
+    
+    Results are cached per tree OID. Consecutive commits share most of their
+    subtrees, so only directories that changed are read and walked again.
+    """
+    with _SUBTREE_CACHE_LOCK:
+        entries = _SUBTREE_CACHE.get(tree.id)
+        if entries is not None:
+            _SUBTREE_CACHE.move_to_end(tree.id)
+            return entries
+            
+    collected = []
+    for entry in tree:
+        if entry.type_str == 'tree':
+            prefix = entry.name + '/'
+            collected.extend(
+                (prefix + path, oid) for path, oid in _walk_tree_cached(pg_repo, pg_repo[entry.id])
+            )
+        elif entry.type_str == 'blob':
+            collected.append((entry.name, entry.id))
+    entries = tuple(collected)
+    
+    with _SUBTREE_CACHE_LOCK:
+        _SUBTREE_CACHE[tree.id] = entries
+        while len(_SUBTREE_CACHE) > _SUBTREE_CACHE_SIZE:
+            _SUBTREE_CACHE.popitem(last=False)
+    return entries
+
+def _read_code_files_git(repo: Repo, repo_path: str, commit_sha: str) -> List[Tuple[str, bytes]]:
+    """
+    Collects (path, content) for every code file in the commit with
+    a single `git ls-tree` and the repo's persistent `git cat-file --batch` process.
+    """
+    # List the entire tree: "<mode> <type> <oid> <size>\t<path>" per entry
+    listing = repo.git.ls_tree('-r', '-l', '-z', commit_sha)
+    
+    code_files = []
+    for entry in listing.split('\0'):
+        if not entry:
+            continue
+        meta, path = entry.split('\t', 1)
+        _mode, obj_type, oid, size = meta.split()
+        if obj_type != 'blob' or not _is_map_candidate(path):
+            continue
+        
+        # Limit: Skip massive files to avoid timeout
+        if int(size) > _MAP_MAX_FILE_SIZE: 
+            continue
+            
+        code_files.append((path, oid))
+        
+    # Partial clones don't have the blobs yet, download the ones we need in one go
+    repo_manager.prefetch_blobs(repo_path, [commit_sha], only=[oid for _, oid in code_files])
+    
+    blobs = repo_manager.read_blobs(repo_path, [oid for _, oid in code_files])
+    return [(path, data) for (path, _oid), data in zip(code_files, blobs) if data is not None]
+
+def _extract_definitions_worker(item: Tuple[str, bytes]) -> Tuple[str, Optional[List[str]]]:
+    """
+    Extracts the definitions of one file. Module-level so the process pool can pickle it.
+    """
+    path, data = item
+    if looks_binary(data):
+        return path, None # Skip binary files
+    return path, _extract_definitions(data, path)
+
+def _get_map_pool() -> Executor:
+    """
+    Lazily creates the shared pool used by generate_repo_map.
+    Celery prefork workers are daemonic and can't start child processes, so they get threads.
+    """
+    global _MAP_POOL
+    with _MAP_POOL_LOCK:
+        if _MAP_POOL is None:
+            workers = max(1, 3 * (os.cpu_count() or 1) // 4)
+            if multiprocessing.current_process().daemon:
+                _MAP_POOL = ThreadPoolExecutor(max_workers=workers)
+            else:
+                _MAP_POOL = ProcessPoolExecutor(max_workers=workers)
+        return _MAP_POOL
+
+def _extract_definitions(content: bytes, file_path: str) -> List[str]:
     """
     Extracts class and function definitions using Regex.
     This is a simple heuristic, not a full AST parser.
+    Only the matched definitions are decoded.
     """
     defs = []
     
     # Python Patterns
     if file_path.endswith('.py'):
-        # Match 'class MyClass:' or 'def my_func('
-        matches = re.findall(r'^\s*(class\s+\w+|def\s+\w+)', content, re.MULTILINE)
-        defs.extend(matches)
+        defs.extend(m.decode('utf-8', 'replace') for m in _PY_DEF_RE.findall(content))
         
     # JS/TS Patterns
     elif file_path.endswith(('.js', '.ts', '.jsx', '.tsx')):
-        # Match 'function myFunc', 'class MyClass', 'const myFunc = () =>'
-        matches = re.findall(r'^\s*(function\s+\w+|class\s+\w+|const\s+\w+\s*=\s*(\(.*?\)|.*?)\s*=>)', content, re.MULTILINE)
         # Clean up JS arrow functions for cleaner output
         clean_matches = []
-        for m in matches:
-            if isinstance(m, tuple):
-                m = m[0] # Take full match
+        for m in _JS_DEF_RE.findall(content):
+            m = m.decode('utf-8', 'replace')
             if '=>' in m:
                 # simplify 'const foo = () =>' to 'const foo'
                 m = m.split('=')[0].strip()
@@ -1,39 +1,246 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from contextlib import asynccontextmanager
+from pydantic import ValidationError
 import redis.asyncio as redis
 from fastapi_limiter import FastAPILimiter
 from fastapi_limiter.depends import RateLimiter
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
+from fastapi_cache.coder import Coder, JsonCoder
 from fastapi_cache.decorator import cache
 
 from . import schemas
 from .core.config import settings
 from .security import validation
 from .git_logic import tools, repo_manager
+from .tasks.celery_app import celery_app
+from celery.result import AsyncResult
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import hashlib
+import json
 import os
+import posixpath
+import time
+import weakref
+from typing import Any, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Git work is blocking (subprocesses, disk I/O), so it runs on a thread pool
+# instead of stalling the event loop for every other request.
+# The threads mostly wait on git subprocesses, so the pool is larger than the CPU count.
+_GIT_POOL_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+async def run_git(fn, *args):
+    """
+    Runs a blocking git function on the git thread pool and awaits its result.
+    """
+    return await asyncio.to_thread(fn, *args)
+
+# One lock per repo URL, so concurrent requests for the same repo wait for a
+# single clone/fetch instead of racing their own. Unused locks are dropped.
+_repo_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+async def get_repo_path(repo_url: str) -> str:
+    """
+    Clones or refreshes repo_url (see repo_manager.get_repo) and returns its local path.
+    """
+    lock = _repo_locks.get(repo_url)
+    if lock is None:
+        lock = _repo_locks[repo_url] = asyncio.Lock()
+    async with lock:
+        return await run_git(repo_manager.get_repo, repo_url)
+
+class ORJSONCoder(Coder):
+    """
+    Encodes cached responses with orjson: faster than the default JsonCoder
+    (json + jsonable_encoder) and more compact, which matters for large trees.
+    Decoded values are plain dicts, FastAPI validates them against the response_model.
+    """
+    @classmethod
+    def encode(cls, value: Any) -> bytes:
+        return orjson.dumps(value, default=_model_to_json)
+
+    @classmethod
+    def decode(cls, value: bytes) -> Any:
+        return orjson.loads(value)
+
+def _model_to_json(obj):
+    # Tool results contain pydantic models (TreeItem, DiffStats, ...)
+    return obj.model_dump(mode="json")
+
+def repo_key_builder(func, namespace: str = "", *, request=None, response=None, args=(), kwargs=None) -> str:
+    """
+    Builds the Redis cache key from what actually determines a response:
+    repo URL, commit, path and line range, instead of hashing the whole request body.
+    """
+    body = (kwargs or {}).get("request") or args[0]
+    path = getattr(body, "path", None) or ""
+    path = posixpath.normpath(path.strip("/")) if path.strip("/") else ""
+    return ":".join([
+        namespace,
+        func.__name__,
+        body.repo_url.lower().rstrip("/"),
+        getattr(body, "commit_hash", None) or "HEAD",
+        path,
+        str(getattr(body, "start_line", "")),
+        str(getattr(body, "end_line", "")),
+    ])
+
+@functools.lru_cache(maxsize=4096)
+def _resolve_safe(repo_path: str, user_path: str) -> tuple[str, str]:
+    """
+    Validates user_path inside repo_path and returns (safe_path, relative_path).
+    Cached because the realpath syscalls repeat for every request on the same path;
+    clones are never checked out, so there are no worktree symlinks to go stale.
+    Unsafe paths raise ValueError, which lru_cache doesn't store.
+    """
+    return validation.validate_safe_path(repo_path, user_path)
+
+async def resolve_repo_and_path(repo_url: str, path: Optional[str] = None) -> tuple[str, Optional[str]]:
+    """
+    Resolves the repo and, if given, validates path inside it.
+    Returns (repo_path, relative_path); relative_path is None when no path was given.
+    Invalid URLs and unsafe paths raise ValueError (clone failures RuntimeError),
+    which the app's exception handlers report as 400 errors.
+    """
+    repo_path = await get_repo_path(repo_url)
+    if path is None:
+        return repo_path, None
+    _, relative_path = _resolve_safe(repo_path, path)
+    return repo_path, relative_path
+
+# Results of tool calls currently running, see singleflight
+_inflight: dict[str, asyncio.Future] = {}
+
+def singleflight(fn):
+    """
+    Coalesces concurrent identical calls (same repo_key_builder key) into one:
+    the first caller runs fn and everyone arriving meanwhile awaits its result,
+    so a burst of cold requests runs the git work once instead of N times.
+    """
+    @functools.wraps(fn)
+    async def wrapper(request):
+        key = repo_key_builder(fn, "singleflight", args=(request,))
+        future = _inflight.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The first caller went away (client disconnect), do the work ourselves
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    return await wrapper(request)
+                raise
+                
+        future = asyncio.get_running_loop().create_future()
+        _inflight[key] = future
+        try:
+            result = await fn(request)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # Retrieved, so asyncio doesn't log it when nobody was waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            _inflight.pop(key, None)
+    
+    return wrapper
+
+def is_pinned_commit(commit_hash: Optional[str]) -> bool:
+    """
+    Returns True if commit_hash is a full SHA, whose responses never go stale.
+    """
+    return repo_manager.is_full_sha(commit_hash)
+
+async def pin_request(request):
+    """
+    Returns a copy of request with commit_hash (HEAD when None) resolved to a full SHA,
+    so the cache key names an immutable commit and a new push simply produces a new key.
+    A commit_hash that doesn't resolve is left as is for the tool to report.
+    """
+    if is_pinned_commit(request.commit_hash):
+        return request
+    repo_path, _ = await resolve_repo_and_path(request.repo_url)
+    sha = await run_git(repo_manager.resolve_commit_sha, repo_path, request.commit_hash)
+    if sha is None:
+        return request
+    return request.model_copy(update={"commit_hash": sha})
+
+# Responses for a full SHA never change, so cached entries can live this long
+_PINNED_EXPIRE = 7 * 86400
 
 # Define startup/shutdown logic
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Install the git pool as the loop's default executor, used by run_git (asyncio.to_thread).
+    # The loop owns it from here and shuts it down when it closes.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=_GIT_POOL_WORKERS, thread_name_prefix="git")
+    )
+    
     # Connect to Redis
+    # Explicit pools sized by REDIS_MAX_CONNECTIONS; when every connection is busy,
+    # requests wait for a free one instead of failing with "Too many connections"
     try:
-        redis_connection = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+        redis_pool = redis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            encoding="utf-8",
+            decode_responses=True,
+        )
+        redis_connection = redis.Redis(connection_pool=redis_pool)
         
         # Initialize Rate Limiter
-        await FastAPILimiter.init(redis_connection)
+        if settings.ENABLE_RATE_LIMIT:
+            await FastAPILimiter.init(redis_connection)
         
         # Initialize Caching
-        FastAPICache.init(RedisBackend(redis_connection), prefix="git-mcp-cache")
+        # The cache stores raw encoded bytes, so it gets a pool without decode_responses
+        cache_pool = redis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+        )
+        cache_connection = redis.Redis(connection_pool=cache_pool)
+        FastAPICache.init(
+            RedisBackend(cache_connection),
+            prefix="git-mcp-cache",
+            coder=ORJSONCoder if orjson is not None else JsonCoder,
+            enable=settings.ENABLE_CACHE,
+        )
         
         yield
     except Exception as e:
         print(f"Warning: Redis connection failed: {e}")
         yield
     finally:
-        if 'redis_connection' in locals():
-            await redis_connection.close()
+        if 'redis_pool' in locals():
+            await redis_pool.disconnect()
+        if 'cache_pool' in locals():
+            await cache_pool.disconnect()
+
+def rate_limit(times: int, seconds: int) -> list:
+    """
+    Returns the rate limiting dependencies for an endpoint, none if ENABLE_RATE_LIMIT is off.
+    """
+    if not settings.ENABLE_RATE_LIMIT:
+        return []
+    return [Depends(RateLimiter(times=times, seconds=seconds))]
 
+# No default_response_class here: for endpoints with a response_model, FastAPI
+# serializes straight to JSON bytes with pydantic-core, and any custom response
+# class (e.g. ORJSONResponse) switches that fast path off.
 app = FastAPI(
     title="Git-Aware Semantic DevOps Server",
     description="A 'Generation 2' MCP server that provides structured, semantic answers about any public Git repository.",
@@ -41,82 +248,115 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Bad repo URLs, unsafe paths and failed clones surface as ValueError/RuntimeError
+# from anywhere in a request; one handler turns them into 400s, so endpoints
+# and helpers don't each need a try/except to translate them.
+@app.exception_handler(ValueError)
+@app.exception_handler(RuntimeError)
+async def bad_request_handler(request: Request, exc: Exception) -> JSONResponse:
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+# GET endpoints build their request models by hand, so a bad query parameter raises
+# pydantic's ValidationError (a ValueError) instead of FastAPI's own validation error.
+# Answer it like FastAPI would: a 422 with the list of errors.
+@app.exception_handler(ValidationError)
+async def validation_error_handler(request: Request, exc: ValidationError) -> JSONResponse:
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(exc.errors(include_url=False))})
+
 # --- Core Public Endpoints ---
+# fastapi-cache never caches non-GET requests, so @cache sits on a helper that
+# each POST endpoint awaits rather than on the endpoint itself.
+# Helpers return plain dicts; FastAPI validates them once against the response_model.
+
+@singleflight
+async def _get_public_tree(request: schemas.PublicTreeRequest) -> dict:
+    # An empty path or "/" means the repository root
+    tree_path = request.path if request.path and request.path != "/" else None
+    repo_path, relative_path = await resolve_repo_and_path(request.repo_url, tree_path)
+
+    tree_data = await run_git(tools.get_tree_at_commit, repo_path, relative_path, request.commit_hash)
+    
+    if tree_data is None:
+        raise HTTPException(
+            status_code=404, 
+            detail=f"Path or commit not found: {request.path or '/'}"
+        )
+    return tree_data
+
+# Only pinned commits are cached; requests are pinned first, so this covers HEAD too
+_get_public_tree_cached = cache(key_builder=repo_key_builder, expire=_PINNED_EXPIRE)(_get_public_tree)
 
 @app.post("/public/get_tree_structure",
           response_model=schemas.TreeResponse,
           summary="Get file tree structure",
-          description="Returns the full directory structure. Cached for 1 hour.",
+          description="Returns the full directory structure. Cached for 7 days per resolved commit.",
           tags=["Repository Analysis"],
-          dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-@cache(expire=3600) # Cache this response for 1 hour (3600 seconds)
+          dependencies=rate_limit(times=10, seconds=60))
 async def api_get_public_tree(request: schemas.PublicTreeRequest):
-    try:
-        repo_path = repo_manager.get_repo(request.repo_url)
-        relative_path = None
-        if request.path and request.path != "/":
-            safe_path = validation.validate_safe_path(repo_path, request.path)
-            relative_path = os.path.relpath(safe_path, repo_path)
-            
-    except (ValueError, RuntimeError) as e:
-        raise HTTPException(status_code=400, detail=str(e))
-
-    tree_data = tools.get_tree_at_commit(repo_path, relative_path, request.commit_hash)
+    request = await pin_request(request)
+    if is_pinned_commit(request.commit_hash):
+        return await _get_public_tree_cached(request)
+    return await _get_public_tree(request)
+
+
+@cache(key_builder=repo_key_builder, expire=300) # Cache for 5 minutes (Git history changes frequently at HEAD)
+@singleflight
+async def _get_public_file_history(request: schemas.PublicFileHistoryRequest) -> dict:
+    repo_path, relative_path = await resolve_repo_and_path(request.repo_url, request.path)
+
+    history = await run_git(tools.get_history_for_file, repo_path, relative_path)
     
-    if tree_data is None:
+    if not history:
         raise HTTPException(
             status_code=404, 
-            detail=f"Path or commit not found: {request.path or '/'}"
+            detail=f"File not found or no history for: {request.path}"
         )
-    return schemas.TreeResponse(**tree_data)
 
+    return {"file": relative_path, "commits": history}
 
 @app.post("/public/get_file_history",
           response_model=schemas.FileHistoryResponse,
           summary="Get commit history for a file",
           description="Returns a list of commits. Cached for 5 minutes.",
           tags=["Repository Analysis"],
-          dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-@cache(expire=300) # Cache for 5 minutes (Git history changes frequently at HEAD)
+          dependencies=rate_limit(times=10, seconds=60))
 async def api_get_public_file_history(request: schemas.PublicFileHistoryRequest):
-    try:
-        repo_path = repo_manager.get_repo(request.repo_url)
-        safe_path = validation.validate_safe_path(repo_path, request.path)
-        relative_path = os.path.relpath(safe_path, repo_path)
+    return await _get_public_file_history(request)
 
-    except (ValueError, RuntimeError) as e:
-        raise HTTPException(status_code=400, detail=str(e))
 
-    history = tools.get_history_for_file(repo_path, relative_path)
-    
-    if not history:
-        raise HTTPException(
-            status_code=404, 
-            detail=f"File not found or no history for: {request.path}"
-        )
+# Whole-file reads above this size are streamed as plain text instead of wrapped in JSON,
+# and above the hard cap callers must ask for a line range
+_STREAM_CONTENT_BYTES = 1024 * 1024
+_MAX_CONTENT_BYTES = 5 * 1024 * 1024
 
-    return schemas.FileHistoryResponse(file=relative_path, commits=history)
+class _LargeFile(Exception):
+    """
+    Raised by _get_public_file_content for a whole file too large for a JSON response,
+    so the endpoint streams it instead. Raised rather than returned, so it's never cached.
+    """
+    def __init__(self, repo_path: str, relative_path: str, size: int):
+        super().__init__(relative_path)
+        self.repo_path = repo_path
+        self.relative_path = relative_path
+        self.size = size
 
-
-@app.post("/public/get_file_content",
-          response_model=schemas.FileContentResponse,
-          summary="Read file content",
-          description="Returns file content. Cached for 1 hour if commit_hash is provided.",
-          tags=["Repository Analysis"],
-          dependencies=[Depends(RateLimiter(times=20, seconds=60))])
-# We use a custom key builder or simple expiration. 
-# If commit_hash is NULL (HEAD), we cache for short time. If explicit, we can cache longer.
-# For simplicity, we cache for 10 minutes.
-@cache(expire=600) 
-async def api_get_public_file_content(request: schemas.PublicFileContentRequest):
-    try:
-        repo_path = repo_manager.get_repo(request.repo_url)
-        safe_path = validation.validate_safe_path(repo_path, request.path)
-        relative_path = os.path.relpath(safe_path, repo_path)
-    except (ValueError, RuntimeError) as e:
-        raise HTTPException(status_code=400, detail=str(e))
+@singleflight
+async def _get_public_file_content(request: schemas.PublicFileContentRequest) -> dict:
+    repo_path, relative_path = await resolve_repo_and_path(request.repo_url, request.path)
+    
+    # Only reached on a cache miss, cached responses are all small enough for JSON
+    if request.start_line is None and request.end_line is None:
+        size = await run_git(tools.get_file_size_at_commit, repo_path, relative_path, request.commit_hash)
+        if size is not None and size > _MAX_CONTENT_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File is {size} bytes, request a range with start_line/end_line: {request.path}"
+            )
+        if size is not None and size > _STREAM_CONTENT_BYTES:
+            raise _LargeFile(repo_path, relative_path, size)
         
-    content_data = tools.get_file_content_at_commit(
+    content_data = await run_git(
+        tools.get_file_content_at_commit,
         repo_path, 
         relative_path, 
         request.commit_hash,
@@ -129,52 +369,260 @@ async def api_get_public_file_content(request: schemas.PublicFileContentRequest)
             status_code=404, 
             detail=f"File not found or commit invalid: {request.path}"
         )
-    return schemas.FileContentResponse(**content_data)
+    return content_data
 
+# Only pinned commits are cached; requests are pinned first, so this covers HEAD too
+_get_public_file_content_cached = cache(key_builder=repo_key_builder, expire=_PINNED_EXPIRE)(_get_public_file_content)
 
-@app.post("/public/get_commit_diff",
-          response_model=schemas.CommitDiffResponse,
-          summary="Get commit changes (Diff)",
-          description="Returns diff stats. Cached for 24 hours (Diffs are immutable).",
+async def _stream_file_content(request: schemas.PublicFileContentRequest, large: _LargeFile):
+    """
+    Streams a large file straight from its blob as text/plain.
+    Non-UTF-8 files get the usual binary placeholder instead; that is checked
+    in a first pass, since a response can't change its content type halfway through.
+    """
+    is_text = await run_git(tools.is_text_file_at_commit, large.repo_path, large.relative_path, request.commit_hash)
+    chunks = None
+    if is_text:
+        chunks = await run_git(tools.iter_file_at_commit, large.repo_path, large.relative_path, request.commit_hash)
+    if chunks is None:
+        return tools.binary_file_content(large.relative_path, request.commit_hash, large.size)
+    return StreamingResponse(chunks, media_type="text/plain; charset=utf-8")
+
+@app.post("/public/get_file_content",
+          response_model=schemas.FileContentResponse,
+          summary="Read file content",
+          description=(
+              "Returns file content. Cached for 7 days per resolved commit. "
+              "Whole text files over 1 MB are streamed as text/plain; "
+              "files over 5 MB must be read with start_line/end_line."
+          ),
           tags=["Repository Analysis"],
-          dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-@cache(expire=86400) # Cache for 24 hours! Diffs never change for a hash.
-async def api_get_public_commit_diff(request: schemas.PublicCommitDiffRequest):
+          dependencies=rate_limit(times=20, seconds=60))
+async def api_get_public_file_content(request: schemas.PublicFileContentRequest):
+    request = await pin_request(request)
     try:
-        repo_path = repo_manager.get_repo(request.repo_url)
-    except (ValueError, RuntimeError) as e:
-        raise HTTPException(status_code=400, detail=str(e))
+        if is_pinned_commit(request.commit_hash):
+            return await _get_public_file_content_cached(request)
+        return await _get_public_file_content(request)
+    except _LargeFile as large:
+        return await _stream_file_content(request, large)
+
+
+@singleflight
+async def _get_public_commit_diff(request: schemas.PublicCommitDiffRequest) -> dict:
+    repo_path, _ = await resolve_repo_and_path(request.repo_url)
     
-    diff_data = tools.get_diff_for_commit(repo_path, request.commit_hash)
+    diff_data = await run_git(tools.get_diff_for_commit, repo_path, request.commit_hash)
     
     if diff_data is None:
         raise HTTPException(
             status_code=404, 
             detail=f"Commit not found: {request.commit_hash}"
         )
-    return schemas.CommitDiffResponse(**diff_data)
+    return diff_data
+
+# Diffs never change for a hash, so pinned commits are cached for 30 days
+_get_public_commit_diff_cached = cache(key_builder=repo_key_builder, expire=30 * 86400)(_get_public_commit_diff)
+
+@app.post("/public/get_commit_diff",
+          response_model=schemas.CommitDiffResponse,
+          summary="Get commit changes (Diff)",
+          description="Returns diff stats. Cached for 30 days (Diffs are immutable).",
+          tags=["Repository Analysis"],
+          dependencies=rate_limit(times=10, seconds=60))
+async def api_get_public_commit_diff(request: schemas.PublicCommitDiffRequest):
+    request = await pin_request(request)
+    if is_pinned_commit(request.commit_hash):
+        return await _get_public_commit_diff_cached(request)
+    return await _get_public_commit_diff(request)
+
+
+# Repo maps are built by the Celery worker (git_tasks.build_repo_map_task) and polled
+# through /jobs/status. The job id is derived from the repo and resolved commit, so the
+# stored result (kept by the result backend for a day) doubles as the cache.
+_REPO_MAP_TASK = 'app.tasks.git_tasks.build_repo_map_task'
+
+# Jobs this process queued recently, so a burst of requests doesn't queue the same map twice
+_repo_map_queued_at: dict[str, float] = {}
+
+def repo_map_job_id(repo_url: str, commit_hash: str) -> str:
+    """
+    Returns the job id for the map of repo_url at commit_hash (a full SHA).
+    """
+    key = f"{repo_url.lower().rstrip('/')}:{commit_hash}"
+    return "repo-map-" + hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+
+def get_job_status(job_id: str) -> dict:
+    """
+    Reads a job's state from the Celery result backend (blocking, run it in a thread).
+    Unknown ids report PENDING, Celery can't tell them apart from queued jobs.
+    """
+    job = AsyncResult(job_id, app=celery_app)
+    status = {"job_id": job_id, "status": job.state}
+    if job.state == "SUCCESS":
+        status["result"] = job.result
+    elif job.state == "FAILURE":
+        status["error"] = str(job.result)
+    return status
+
+def queue_repo_map_job(repo_url: str, commit_hash: str) -> dict:
+    """
+    Returns the status of the repo map job for commit_hash, queuing it unless it
+    is already done, running, or was queued by this process within the task time limit.
+    """
+    job_id = repo_map_job_id(repo_url, commit_hash)
+    status = get_job_status(job_id)
+    if status["status"] not in ("PENDING", "FAILURE", "REVOKED"):
+        # Started or finished, the backend tracks it from here on
+        _repo_map_queued_at.pop(job_id, None)
+        return status
+
+    now = time.time()
+    time_limit = celery_app.conf.task_time_limit
+    if status["status"] == "PENDING" and now - _repo_map_queued_at.get(job_id, 0) < time_limit:
+        return status
+    # Forget jobs queued longer ago than the time limit, so the dict stays small
+    for key, queued_at in list(_repo_map_queued_at.items()):
+        if now - queued_at >= time_limit:
+            _repo_map_queued_at.pop(key, None)
+    _repo_map_queued_at[job_id] = now
+
+    # A failed job is retried under the same id, the new result replaces the old one
+    celery_app.send_task(_REPO_MAP_TASK, args=[repo_url, commit_hash], task_id=job_id, retry=False)
+    return {"job_id": job_id, "status": "PENDING"}
 
 @app.post("/public/get_repo_map",
-          response_model=schemas.RepoMapResponse,
+          response_model=schemas.JobResponse,
+          response_model_exclude_none=True,
+          status_code=202,
           summary="Get repository map",
-          description="Returns a compressed map of the codebase. Cached for 1 hour.",
+          description=(
+              "Queues building a compressed map of the codebase and returns a job id "
+              "to poll with /jobs/status/{job_id}. Once built, the map is kept for 1 day "
+              "and returned straight away (status SUCCESS)."
+          ),
           tags=["Repository Analysis"],
-          dependencies=[Depends(RateLimiter(times=5, seconds=60))])
-@cache(expire=3600) # Expensive operation, definitely cache it!
+          dependencies=rate_limit(times=5, seconds=60))
 async def api_get_repo_map(request: schemas.RepoMapRequest):
+    request = await pin_request(request)
+    if not is_pinned_commit(request.commit_hash):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Commit not found: {request.commit_hash or 'HEAD'}"
+        )
     try:
-        repo_path = repo_manager.get_repo(request.repo_url)
-    except (ValueError, RuntimeError) as e:
-        raise HTTPException(status_code=400, detail=str(e))
-        
-    repo_map = tools.generate_repo_map(repo_path, request.commit_hash)
-    
-    if repo_map is None:
-        raise HTTPException(status_code=500, detail="Failed to generate repo map")
-        
-    return schemas.RepoMapResponse(**repo_map)
+        return await asyncio.to_thread(queue_repo_map_job, request.repo_url, request.commit_hash)
+    except Exception as e:
+        print(f"Could not queue repo map job: {e}")
+        raise HTTPException(status_code=503, detail="Background workers are unavailable")
+
+@app.get("/jobs/status/{job_id}",
+         response_model=schemas.JobResponse,
+         response_model_exclude_none=True,
+         summary="Get background job status",
+         description="Returns the state of a background job and, once it succeeded, its result.",
+         tags=["Jobs"],
+         dependencies=rate_limit(times=60, seconds=60))
+async def api_get_job_status(job_id: str):
+    try:
+        return await asyncio.to_thread(get_job_status, job_id)
+    except Exception as e:
+        print(f"Could not read job status for {job_id}: {e}")
+        raise HTTPException(status_code=503, detail="Job results are unavailable")
+
+
+# --- Commit-addressed GET endpoints ---
+# GET twins of the tree, content and diff tools, so HTTP caches (CDNs, proxies,
+# browsers) can serve repeats without reaching the server. A full SHA in the URL
+# never changes, so those responses are marked immutable; anything else
+# (a branch or short hash) gets an ETag to revalidate against instead.
+
+_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Returns True if an If-None-Match header value matches etag (weak comparison).
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+async def immutable_get(http_request: Request, response: Response, request, endpoint):
+    """
+    Runs a POST endpoint for a GET request, adding ETag and Cache-Control headers
+    and answering If-None-Match revalidations with 304 without doing any work.
+    """
+    immutable = is_pinned_commit(request.commit_hash)
+    request = await pin_request(request)
+    if not is_pinned_commit(request.commit_hash):
+        return await endpoint(request) # The endpoint reports the bad commit
+
+    # The key names the tool, repo, resolved commit, path and line range
+    key = repo_key_builder(endpoint, "etag", args=(request,))
+    etag = '"' + hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest() + '"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": _IMMUTABLE_CACHE_CONTROL if immutable else "no-cache",
+    }
+    if etag_matches(http_request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    result = await endpoint(request)
+    # Large files come back as a StreamingResponse that FastAPI sends as is
+    target = result if isinstance(result, Response) else response
+    target.headers.update(headers)
+    return result
+
+@app.get("/public/commits/{commit_hash}/tree",
+         response_model=schemas.TreeResponse,
+         summary="Get file tree structure (GET)",
+         description="GET version of /public/get_tree_structure. Immutable for a full commit hash.",
+         tags=["Repository Analysis"],
+         dependencies=rate_limit(times=10, seconds=60))
+@app.get("/public/commits/{commit_hash}/tree/{path:path}",
+         response_model=schemas.TreeResponse,
+         include_in_schema=False,
+         dependencies=rate_limit(times=10, seconds=60))
+async def api_get_commit_tree(http_request: Request, response: Response, commit_hash: str,
+                              repo_url: str, path: Optional[str] = None):
+    request = schemas.PublicTreeRequest(repo_url=repo_url, commit_hash=commit_hash, path=path or None)
+    return await immutable_get(http_request, response, request, api_get_public_tree)
+
+@app.get("/public/commits/{commit_hash}/content/{path:path}",
+         response_model=schemas.FileContentResponse,
+         summary="Read file content (GET)",
+         description="GET version of /public/get_file_content. Immutable for a full commit hash.",
+         tags=["Repository Analysis"],
+         dependencies=rate_limit(times=20, seconds=60))
+async def api_get_commit_file_content(http_request: Request, response: Response, commit_hash: str, path: str,
+                                      repo_url: str, start_line: Optional[int] = None, end_line: Optional[int] = None):
+    request = schemas.PublicFileContentRequest(
+        repo_url=repo_url, commit_hash=commit_hash, path=path, start_line=start_line, end_line=end_line
+    )
+    return await immutable_get(http_request, response, request, api_get_public_file_content)
+
+@app.get("/public/commits/{commit_hash}/diff",
+         response_model=schemas.CommitDiffResponse,
+         summary="Get commit changes (Diff) (GET)",
+         description="GET version of /public/get_commit_diff. Immutable for a full commit hash.",
+         tags=["Repository Analysis"],
+         dependencies=rate_limit(times=10, seconds=60))
+async def api_get_commit_diff(http_request: Request, response: Response, commit_hash: str, repo_url: str):
+    request = schemas.PublicCommitDiffRequest(repo_url=repo_url, commit_hash=commit_hash)
+    return await immutable_get(http_request, response, request, api_get_public_commit_diff)
+
 
+# Load balancers probe this constantly, so the body is serialized once at import.
+# The handler is async so probes don't hop through the threadpool either.
+_HEALTH_BODY = json.dumps(
+    {"status": "ok", "message": "Git-Aware Semantic DevOps Server is running."},
+    separators=(",", ":")
+).encode("utf-8")
 
 @app.get("/", summary="Server Health Check", tags=["Health"])
-def read_root():
-    return {"status": "ok", "message": "Git-Aware Semantic DevOps Server is running."}
\ No newline at end of file
+async def read_root():
+    return Response(content=_HEALTH_BODY, media_type="application/json")
\ No newline at end of file
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List, Any
+from typing import Optional
 
 # --- Reusable Components ---
 
@@ -14,6 +14,12 @@ class CommitInfo(BaseModel):
     date: datetime
     message: str
 
+class _RepoUrlMixin(BaseModel):
+    """
+    The repo_url field shared by every /public request, declared once.
+    """
+    repo_url: str = Field(..., description="The public HTTPS URL of the Git repository.")
+
 # --- Tool: /get_file_history ---
 
 class FileHistoryRequest(BaseModel):
@@ -29,11 +35,10 @@ class FileHistoryResponse(BaseModel):
     file: str
     commits: list[CommitInfo]
 
-class PublicFileHistoryRequest(FileHistoryRequest):
+class PublicFileHistoryRequest(_RepoUrlMixin, FileHistoryRequest):
     """
     Input for the /public/get_file_history endpoint.
     """
-    repo_url: str = Field(..., description="The public HTTPS URL of the Git repository.")
 
 # --- Tool: /get_file_content ---
 
@@ -41,8 +46,7 @@ class FileContentRequest(BaseModel):
     path: str = Field(..., description="Relative path to the file within the repository.")
     commit_hash: Optional[str] = Field(None, description="Specific commit hash. Defaults to HEAD (latest).")
 
-class PublicFileContentRequest(FileContentRequest):
-    repo_url: str = Field(..., description="The public HTTPS URL of the Git repository.")
+class PublicFileContentRequest(_RepoUrlMixin, FileContentRequest):
     # New fields for Smart Context Trimming
     start_line: Optional[int] = Field(None, description="Start reading from this line number (1-based).")
     end_line: Optional[int] = Field(None, description="Stop reading at this line number (inclusive).")
@@ -60,8 +64,8 @@ class TreeRequest(BaseModel):
     commit_hash: Optional[str] = Field(None, description="Specific commit hash. Defaults to HEAD (latest).")
     path: Optional[str] = Field(None, description="Subdirectory to get tree for. Defaults to root.")
 
-class PublicTreeRequest(TreeRequest):
-    repo_url: str = Field(..., description="The public HTTPS URL of the Git repository.")
+class PublicTreeRequest(_RepoUrlMixin, TreeRequest):
+    pass
 
 class TreeItem(BaseModel):
     path: str
@@ -72,15 +76,15 @@ class TreeItem(BaseModel):
 class TreeResponse(BaseModel):
     commit_hash: str
     path: str
-    tree: List[TreeItem]
+    tree: list[TreeItem]
 
 # --- Tool: /get_commit_diff ---
 
 class CommitDiffRequest(BaseModel):
     commit_hash: str = Field(..., description="The commit hash to get the diff for.")
 
-class PublicCommitDiffRequest(CommitDiffRequest):
-    repo_url: str = Field(..., description="The public HTTPS URL of the Git repository.")
+class PublicCommitDiffRequest(_RepoUrlMixin, CommitDiffRequest):
+    pass
 
 class DiffStats(BaseModel):
     lines_added: int
@@ -95,18 +99,25 @@ class DiffStats(BaseModel):
 class CommitDiffResponse(BaseModel):
     commit_hash: str
     parent_hash: str
-    changes: List[DiffStats]
+    changes: list[DiffStats]
 
 # --- Tool: /get_repo_map ---
 
-class RepoMapRequest(BaseModel):
-    repo_url: str = Field(..., description="The public HTTPS URL of the Git repository.")
+class RepoMapRequest(_RepoUrlMixin):
     commit_hash: Optional[str] = Field(None, description="Specific commit hash. Defaults to HEAD.")
 
 class RepoMapItem(BaseModel):
     file_path: str
-    definitions: List[str] # e.g. "class User", "def get_user()"
+    definitions: list[str] # e.g. "class User", "def get_user()"
 
 class RepoMapResponse(BaseModel):
     commit_hash: str
-    map: List[RepoMapItem]
\ No newline at end of file
+    map: list[RepoMapItem]
+
+# --- Background jobs ---
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str # Celery state: PENDING, STARTED, SUCCESS, FAILURE, ...
+    result: Optional[dict] = None # The job's result once it succeeded, e.g. a RepoMapResponse
+    error: Optional[str] = None
\ No newline at end of file
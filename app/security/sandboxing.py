@@ -1,6 +1,10 @@
 import os
 import logging
-import shlex  # <--- CRITICAL SECURITY IMPORT
+import re
+import threading
+import time
+from collections import deque
+from ..core.config import settings
 
 # We wrap the import in a try/except block so the server 
 # doesn't crash immediately if docker is not installed (Phase 1/2 usage).
@@ -13,24 +17,214 @@ except ImportError:
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Lightweight image that has git installed (alpine/git by default, see SANDBOX_IMAGE in config)
+SANDBOX_IMAGE = settings.SANDBOX_IMAGE
+
+# Seconds a bisect may run before it's killed
+_BISECT_TIMEOUT = 300
+
+# Only the end of the bisect output is kept; long test runs can log many MB
+LOG_TAIL_BYTES = 1024 * 1024
+_TRUNCATED_MARKER = b"[... earlier output truncated ...]\n"
+
+# Standard git output: "123456... is the first bad commit", matched on the raw log bytes
+_BISECT_RE = re.compile(rb'([a-f0-9]+) is the first bad commit')
+
+# The script run INSIDE the container. The commits and test command come from
+# the environment (see run_sandboxed_bisect) and are only ever expanded in quotes.
+# The repo is mounted read-only at /src. Bisect runs in a scratch repo on the
+# /app tmpfs that borrows /src's objects (alternates), so the host clone is
+# never written and several bisects of the same repo can run at once.
+_BISECT_SCRIPT = """
+git config --global safe.directory /src
+bad=$(git --git-dir=/src/.git rev-parse --verify --end-of-options "$BAD_COMMIT^{commit}") || exit 1
+good=$(git --git-dir=/src/.git rev-parse --verify --end-of-options "$GOOD_COMMIT^{commit}") || exit 1
+
+work=$(mktemp -d /app/bisect.XXXXXX) || exit 1
+git init -q "$work"
+echo /src/.git/objects > "$work/.git/objects/info/alternates"
+# The clone is shallow, so history has to stop at the same commits here
+[ -f /src/.git/shallow ] && cp /src/.git/shallow "$work/.git/shallow"
+cd "$work"
+git update-ref --no-deref HEAD "$bad"
+
+# Start bisect
+git bisect start "$bad" "$good"
+
+# Run the automated bisect, the test command is passed to sh as a single argument
+git bisect run /bin/sh -c "$TEST_CMD"
+status=$?
+
+# Drop the working copy, keeping bisect's exit status
+cd /
+rm -rf "$work"
+exit $status
+"""
+
+# Images known to be present locally, so only the first bisect asks the Docker daemon
+_known_images: set[str] = set()
+
+def _clone_id(repo_path: str) -> tuple:
+    """
+    Identifies the clone currently at repo_path. A re-clone creates a new directory
+    (new inode) and a new .git/HEAD, so a container whose bind mount still points
+    at the old, deleted clone is never matched to it.
+    """
+    st = os.stat(repo_path)
+    head_mtime = os.path.getmtime(os.path.join(repo_path, '.git', 'HEAD'))
+    return (repo_path, st.st_dev, st.st_ino, head_mtime)
+
+class _ContainerPool:
+    """
+    Fresh sandbox containers started ahead of time, so a repeat bisect skips
+    creating and starting one. Only containers that never ran a test command are
+    pooled; a used one may hold leftover processes or files, so it is removed.
+    The repo bind mount is fixed when a container is created, so containers are
+    only handed out for the same clone (see _clone_id).
+    Holds at most `size` idle containers; the least recently used is removed first,
+    and any container idle for longer than `idle_ttl` seconds is removed by a reaper thread.
+    """
+    def __init__(self, size: int, idle_ttl: int):
+        self.size = size
+        self.idle_ttl = idle_ttl
+        self._idle = deque() # (clone_id, container, released_at), most recently released last
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._closed = False
+
+    def get(self, clone_id: tuple):
+        """
+        Returns an idle running container for clone_id, or None.
+        Idle containers for an older clone at the same path are removed.
+        """
+        repo_path = clone_id[0]
+        while True:
+            with self._lock:
+                stale = [e for e in self._idle if e[0][0] == repo_path and e[0] != clone_id]
+                for e in stale:
+                    self._idle.remove(e)
+                entry = next((e for e in reversed(self._idle) if e[0] == clone_id), None)
+                if entry is not None:
+                    self._idle.remove(entry)
+            for e in stale:
+                _remove_container(e[1])
+            if entry is None:
+                return None
+            container = entry[1]
+            try:
+                container.reload()
+                if container.status == "running":
+                    return container
+            except Exception:
+                pass
+            _remove_container(container) # Died while idle (e.g. OOM), try the next one
+
+    def put(self, clone_id: tuple, container) -> None:
+        """
+        Adds a fresh container to the pool, evicting the least recently used beyond size.
+        """
+        evicted = []
+        with self._lock:
+            if self._closed: # Worker is shutting down, don't keep it
+                evicted.append(container)
+            else:
+                self._idle.append((clone_id, container, time.monotonic()))
+            while len(self._idle) > self.size:
+                evicted.append(self._idle.popleft()[1])
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_forever, name="sandbox-reaper", daemon=True)
+                self._reaper.start()
+        for old in evicted:
+            _remove_container(old)
+
+    def reap(self) -> None:
+        """
+        Removes containers that have been idle for longer than idle_ttl.
+        """
+        cutoff = time.monotonic() - self.idle_ttl
+        with self._lock:
+            expired = [e for e in self._idle if e[2] < cutoff]
+            for e in expired:
+                self._idle.remove(e)
+        for e in expired:
+            _remove_container(e[1])
+
+    def _reap_forever(self) -> None:
+        while True:
+            time.sleep(max(1, min(self.idle_ttl, 60)))
+            self.reap()
+
+    def close(self) -> None:
+        """
+        Removes every idle container (called when the worker shuts down).
+        """
+        with self._lock:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+        for e in idle:
+            _remove_container(e[1])
+
+_container_pool = _ContainerPool(settings.SANDBOX_POOL_SIZE, settings.SANDBOX_IDLE_TTL)
+
+def close_container_pool() -> None:
+    """
+    Removes the idle sandbox containers of this process.
+    """
+    _container_pool.close()
+
+def _remove_container(container) -> None:
+    try:
+        container.remove(force=True)
+    except Exception:
+        pass
+
+# Shared by every task in the process; only created (and pinged) once
+_docker_client = None
+_docker_client_lock = threading.Lock()
+
 def get_docker_client():
     """
     Safely attempts to get the Docker client.
+    The connected client is kept for the life of the process, so later calls
+    skip docker.from_env() and the ping round trip.
     """
+    global _docker_client
+    if _docker_client is not None:
+        return _docker_client
+    
     if not docker:
         raise ImportError("The 'docker' library is not installed. Please run 'pip install docker'.")
     
+    with _docker_client_lock:
+        if _docker_client is None:
+            try:
+                client = docker.from_env()
+                client.ping() # Test connection
+            except Exception as e:
+                logger.error(f"Could not connect to Docker: {e}")
+                raise RuntimeError("Docker is not running or not accessible. Please start Docker Desktop.")
+            _docker_client = client
+    return _docker_client
+
+def ensure_image(client, image_name: str = SANDBOX_IMAGE) -> None:
+    """
+    Pulls image_name unless it's already present.
+    Only checked once per process; the worker calls this at startup (see celery_app).
+    """
+    if image_name in _known_images:
+        return
     try:
-        client = docker.from_env()
-        client.ping() # Test connection
-        return client
-    except Exception as e:
-        logger.error(f"Could not connect to Docker: {e}")
-        raise RuntimeError("Docker is not running or not accessible. Please start Docker Desktop.")
+        client.images.get(image_name)
+    except ImageNotFound:
+        logger.info(f"Pulling Docker image: {image_name}...")
+        client.images.pull(image_name)
+    _known_images.add(image_name)
 
 def run_sandboxed_bisect(repo_path: str, test_command: str, bad_commit: str, good_commit: str) -> dict:
     """
     Runs a 'git bisect' operation inside a secure Docker container.
+    Each container runs a single bisect and is then removed; a fresh one is
+    started in the background for the next bisect of the same clone.
     
     Args:
         repo_path: Absolute path to the host's repository.
@@ -44,70 +238,45 @@ def run_sandboxed_bisect(repo_path: str, test_command: str, bad_commit: str, goo
     client = get_docker_client()
     
     # 1. Define the Docker image to use. 
-    # Using a lightweight image that has git installed.
-    image_name = "bitnami/git:latest" 
-    
-    # --- SECURITY FIX ---
-    # We strictly quote the user-provided command to prevent shell injection.
-    # This prevents a command like "; rm -rf /" from running.
-    safe_test_command = shlex.quote(test_command)
-    
-    # 2. Prepare the script to run INSIDE the container.
-    # We use an f-string to inject the commit hashes and test command.
-    bisect_script = f"""
-    git config --global --add safe.directory /app
-    cd /app
+    image_name = SANDBOX_IMAGE
     
-    # Reset any potential mess
-    git bisect reset || true
-    
-    # Start bisect
-    git bisect start
-    git bisect bad {bad_commit}
-    git bisect good {good_commit}
-    
-    # Run the automated bisect using the SAFE, QUOTED command
-    git bisect run /bin/sh -c {safe_test_command}
-    """
+    # --- SECURITY ---
+    # 2. User input reaches the script only as environment variables, never as
+    # script text, so nothing the user sends is parsed by the shell
+    # (a command like "; rm -rf /" is just the test command's own text).
+    environment = {
+        "TEST_CMD": test_command,
+        "BAD_COMMIT": bad_commit,
+        "GOOD_COMMIT": good_commit,
+    }
     
     container = None
     try:
         # 3. Pull the image if needed
-        try:
-            client.images.get(image_name)
-        except ImageNotFound:
-            logger.info(f"Pulling Docker image: {image_name}...")
-            client.images.pull(image_name)
-
-        # 4. Run the container
-        logger.info(f"Starting sandbox for repo: {repo_path}")
+        ensure_image(client, image_name)
+
+        # 4. Take a prewarmed container for this clone, or start one that idles until used
+        container = _container_pool.get(_clone_id(repo_path))
+        if container is None:
+            logger.info(f"Starting sandbox for repo: {repo_path}")
+            container = _start_container(client, image_name, repo_path)
+        else:
+            logger.info(f"Using prewarmed sandbox for repo: {repo_path}")
         
-        container = client.containers.run(
-            image_name,
-            # We wrap the entire script in single quotes for the outer shell
-            # This is the second layer of security.
-            command=f"/bin/sh -c {shlex.quote(bisect_script)}",
-            volumes={repo_path: {'bind': '/app', 'mode': 'rw'}}, 
-            working_dir="/app",
-            detach=True, 
-            # Security hardening:
-            network_disabled=True, 
-            mem_limit='512m',      
-            cpu_period=100000,     
-            cpu_quota=50000,
+        # 5. Run the script (killed after 5 minutes). The argv form needs no outer shell.
+        exit_code, output = _exec_tail(
+            container,
+            ["timeout", str(_BISECT_TIMEOUT), "/bin/sh", "-c", _BISECT_SCRIPT],
+            workdir="/app",
+            environment=environment,
         )
-        
-        # 5. Wait for result (timeout after 5 minutes)
-        result = container.wait(timeout=300)
-        logs = container.logs().decode('utf-8')
-        
-        exit_code = result.get('StatusCode', 1)
+        logs = output.decode('utf-8', errors='replace')
         
         return {
             "success": exit_code == 0,
             "exit_code": exit_code,
             "logs": logs,
-            "found_commit": _parse_bisect_result(logs)
+            "found_commit": _parse_bisect_result(output)
         }
 
     except Exception as e:
@@ -117,20 +286,79 @@ def run_sandboxed_bisect(repo_path: str, test_command: str, bad_commit: str, goo
             "error": str(e)
         }
     finally:
-        # 6. Cleanup: Always remove the container
+        # 6. Cleanup: the test command ran as root in this container and may have left
+        # processes or files behind, so it is never reused. Prewarm a fresh one instead.
         if container:
-            try:
-                container.remove(force=True)
-            except Exception:
-                pass
+            _remove_container(container)
+            threading.Thread(
+                target=_prewarm_container, args=(client, image_name, repo_path), daemon=True
+            ).start()
+
+def _start_container(client, image_name: str, repo_path: str):
+    """
+    Starts a sandbox container for repo_path that idles until a bisect runs in it.
+    """
+    return client.containers.run(
+        image_name,
+        # Images like alpine/git use git as their entrypoint, so replace it
+        entrypoint=["sleep", "infinity"],
+        volumes={repo_path: {'bind': '/src', 'mode': 'ro'}}, 
+        tmpfs={'/app': 'size=512m'},
+        working_dir="/app",
+        detach=True, 
+        # Security hardening:
+        network_disabled=True, 
+        mem_limit='512m',      
+        cpu_period=100000,     
+        cpu_quota=50000,
+        labels={"repo-mcp.sandbox": "bisect"},
+    )
+
+def _prewarm_container(client, image_name: str, repo_path: str) -> None:
+    """
+    Starts a fresh container for the clone at repo_path and adds it to the pool.
+    """
+    if _container_pool.size <= 0:
+        return
+    try:
+        clone_id = _clone_id(repo_path)
+        _container_pool.put(clone_id, _start_container(client, image_name, repo_path))
+    except Exception as e:
+        logger.warning(f"Could not prewarm sandbox for {repo_path}: {e}")
+
+def _exec_tail(container, cmd: list, workdir: str, environment: dict = None) -> tuple:
+    """
+    Runs cmd in container, streaming its output and keeping only the last
+    LOG_TAIL_BYTES, so a chatty test suite never sits in memory whole.
+    Returns (exit_code, output bytes).
+    """
+    api = container.client.api
+    exec_id = api.exec_create(container.id, cmd, workdir=workdir, environment=environment)['Id']
+    
+    tail = deque()
+    size = 0
+    truncated = False
+    for chunk in api.exec_start(exec_id, stream=True):
+        tail.append(chunk)
+        size += len(chunk)
+        while size - len(tail[0]) >= LOG_TAIL_BYTES:
+            size -= len(tail.popleft())
+            truncated = True
+    
+    output = b"".join(tail)
+    if size > LOG_TAIL_BYTES:
+        output = output[-LOG_TAIL_BYTES:]
+        truncated = True
+    if truncated:
+        output = _TRUNCATED_MARKER + output
+    return api.exec_inspect(exec_id)['ExitCode'], output
 
-def _parse_bisect_result(logs: str) -> str:
+def _parse_bisect_result(logs: bytes) -> str:
     """
     Helper to extract the bad commit hash from git bisect output.
+    Only the matched hash is decoded.
     """
-    import re
-    # Look for standard git output: "123456... is the first bad commit"
-    match = re.search(r'([a-f0-9]+) is the first bad commit', logs)
+    match = _BISECT_RE.search(logs)
     if match:
-        return match.group(1)
+        return match.group(1).decode('ascii')
     return "Not found"
\ No newline at end of file
@@ -1,8 +1,8 @@
+import functools
 import os
 import re
-from urllib.parse import urlparse
 
-def validate_safe_path(base_dir: str, user_path: str) -> str:
+def validate_safe_path(base_dir: str, user_path: str) -> tuple[str, str]:
     """
     Resolves a user-provided path against a base directory
     and ensures it doesn't escape that directory (Path Traversal).
@@ -10,13 +10,14 @@ def validate_safe_path(base_dir: str, user_path: str) -> str:
     This is a critical security function.
     
     Returns:
-        The absolute, real path if it's safe.
+        (absolute real path, path relative to base_dir) if it's safe.
+        The relative path is "." for base_dir itself.
     
     Raises:
         ValueError: If the path is unsafe.
     """
-    # 1. Normalize both paths to resolve any '..' or '.'
-    base_dir = os.path.realpath(base_dir)
+    # 1. Normalize the base dir (resolved once per base, it's the same repo every request)
+    base_dir = _real_base(base_dir)
     
     # 2. Create the full path by joining the base dir and the user-provided path
     # os.path.join handles path separators correctly, but user_path
@@ -26,59 +27,45 @@ def validate_safe_path(base_dir: str, user_path: str) -> str:
     # 3. Resolve the full path, which will "execute" any '..'
     full_path_real = os.path.realpath(full_path_raw)
     
-    # 4. Get the common prefix of the *resolved* base and full paths
-    common_prefix = os.path.commonprefix([base_dir, full_path_real])
-
-    # 5. Check if the common prefix is the base directory itself.
-    # If it is, the full path is guaranteed to be inside the base_dir.
-    # If the user tried '..', common_prefix would be C:\, not C:\projects\my-repo
-    if common_prefix != base_dir:
+    # 4. The resolved path must be the base dir itself or lie below it.
+    # Comparing against base_dir + separator (not a plain string prefix) keeps
+    # siblings like /clones/repo-evil from passing as inside /clones/repo.
+    if full_path_real == base_dir:
+        return full_path_real, "."
+    base_prefix = base_dir if base_dir.endswith(os.sep) else base_dir + os.sep
+    if not full_path_real.startswith(base_prefix):
         raise ValueError("Path Traversal Attack detected. Path is outside the repository.")
-        
-    return full_path_real
+    
+    # 5. The path is inside base_dir, so its relative form is just the remainder
+    # after base_dir and the separator (no os.path.relpath re-normalization)
+    return full_path_real, full_path_real[len(base_prefix):]
+
+@functools.lru_cache(maxsize=64)
+def _real_base(base_dir: str) -> str:
+    return os.path.realpath(base_dir)
+
+# A safe, public HTTPS Git URL in one anchored pattern (used with fullmatch, so no
+# trailing newline slips through):
+# 1. Must be HTTPS. Deny SSH, FTP, File, etc.
+# 2. Domain must be on our strict allow-list, or a subdomain of it (e.g. gist.github.com).
+#    This prevents the server from cloning from a malicious domain.
+#    No user, password or port can appear, since the host must follow "://" directly.
+# 3. Path must look like /username/reponame or /username/reponame.git,
+#    without tricky characters that might be used in attacks.
+# 4. No query params or fragments.
+_SAFE_GIT_URL_RE = re.compile(
+    r'(?i:https)://(?:[A-Za-z0-9-]+\.)*(?:github\.com|gitlab\.com|bitbucket\.org)'
+    r'/[A-Za-z0-9_.-]+/[A-Za-z0-9_.-]+(?:\.git)?/?'
+)
+
+# Longer URLs are rejected before the regex runs
+_MAX_GIT_URL_LENGTH = 512
 
 def is_safe_git_url(url: str) -> bool:
     """
     Validates that a URL is a safe, public HTTPS Git URL.
     This is a critical security function for Phase 2.
     """
-    try:
-        parsed = urlparse(url)
-        
-        # 1. Must be HTTPS. Deny SSH, FTP, File, etc.
-        if parsed.scheme != 'https':
-            return False
-            
-        # 2. Must have a network location (domain)
-        if not parsed.netloc:
-            return False
-            
-        # 3. Domain must be on our strict allow-list.
-        # This prevents the server from cloning from a malicious domain.
-        allowed_domains = {
-            'github.com',
-            'gitlab.com',
-            'bitbucket.org'
-        }
-        
-        if parsed.netloc not in allowed_domains:
-            # Check for subdomains (e.g., gist.github.com)
-            if not any(parsed.netloc.endswith(f'.{domain}') for domain in allowed_domains):
-                return False
-
-        # 4. Path should be a valid repo path (e.g., /user/repo.git)
-        # This regex checks for a path like /username/reponame or /username/reponame.git
-        # It disallows paths with tricky characters that might be used in attacks.
-        if not re.match(r'^/[A-Za-z0-9_.-]+/[A-Za-z0-9_.-]+(\.git)?/?$', parsed.path):
-            return False
-            
-        # 5. Must not contain user, password, query params, or fragments
-        if parsed.query or parsed.fragment or parsed.username or parsed.password:
-            return False
-
-    except Exception:
-        # Any parsing error (e.g., malformed URL) means it's invalid
+    if not isinstance(url, str) or len(url) > _MAX_GIT_URL_LENGTH:
         return False
-        
-    # If all checks pass, the URL is safe
-    return True
\ No newline at end of file
+    return _SAFE_GIT_URL_RE.fullmatch(url) is not None
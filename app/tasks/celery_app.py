@@ -1,5 +1,43 @@
+import logging
+import zlib
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown, worker_shutdown
+from kombu.serialization import register
 from ..core.config import settings
+from ..security import sandboxing
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Task messages and results are JSON either way; orjson encodes and decodes
+# large payloads (bisect logs, repo maps) several times faster than stdlib json.
+# Results are also zlib-compressed, since the Redis result backend ignores
+# result_compression. Registered in every process that imports the app
+# (API and worker alike).
+if orjson is not None:
+    register(
+        "orjson",
+        orjson.dumps,
+        orjson.loads,
+        content_type="application/x-orjson",
+        content_encoding="binary",
+    )
+    register(
+        "orjson-zlib",
+        lambda obj: zlib.compress(orjson.dumps(obj), 1),
+        lambda data: orjson.loads(zlib.decompress(data)),
+        content_type="application/x-orjson-zlib",
+        content_encoding="binary",
+    )
+    _TASK_SERIALIZER, _RESULT_SERIALIZER = "orjson", "orjson-zlib"
+    _ACCEPT_CONTENT = ["orjson", "json"]
+    _RESULT_ACCEPT_CONTENT = ["orjson-zlib", "orjson", "json"]
+else:
+    # Unregistered serializer names would fail with SerializerNotInstalled
+    _TASK_SERIALIZER = _RESULT_SERIALIZER = "json"
+    _ACCEPT_CONTENT = _RESULT_ACCEPT_CONTENT = ["json"]
 
 # Initialize the Celery application
 # 'git_mcp_worker' is the name of the worker instance
@@ -14,16 +52,51 @@ celery_app = Celery(
 
 # Configure Celery to use JSON for serialization (secure and standard)
 celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],  # Ignore other content formats
-    result_serializer="json",
+    task_serializer=_TASK_SERIALIZER,
+    accept_content=_ACCEPT_CONTENT,  # Ignore other content formats
+    result_accept_content=_RESULT_ACCEPT_CONTENT,
+    result_serializer=_RESULT_SERIALIZER,
     timezone="UTC",
     enable_utc=True,
     # Optional: Task soft time limit (raises exception if task takes too long)
     task_soft_time_limit=600, # 10 minutes
     # Optional: Task hard time limit (kills worker if task takes too long)
     task_time_limit=660,      # 11 minutes
+    # Keep task results (e.g. finished repo maps) for 1 day
+    result_expires=86400,
+    # Tasks mostly wait on git network I/O and Docker, so one process runs many
+    # of them on threads instead of forking a process per concurrent task.
+    # (The thread pool doesn't enforce the time limits above; bisects are
+    # bounded by the timeout inside the sandbox.)
+    worker_pool="threads",
+    worker_concurrency=settings.CELERY_WORKER_CONCURRENCY,
+    # Long-running bisects get a dedicated queue and workers (see docker-compose.yml),
+    # everything else stays on the default "celery" queue
+    task_routes={
+        'app.tasks.git_tasks.run_bisect_task': {'queue': 'bisect'},
+    },
 )
 
+logger = logging.getLogger(__name__)
+
+@worker_init.connect
+def _pull_sandbox_image(sender=None, **kwargs):
+    # Pull before the pool starts, so the first bisect never waits on a pull
+    # (forked children inherit the known image when prefork is used).
+    # Only workers consuming the bisect queue run sandboxes (and have Docker).
+    # Docker being unavailable here isn't fatal, bisect tasks report it themselves.
+    if sender is None or 'bisect' not in sender.app.amqp.queues.consume_from:
+        return
+    try:
+        sandboxing.ensure_image(sandboxing.get_docker_client())
+    except Exception as e:
+        logger.warning(f"Could not prepare sandbox image: {e}")
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _close_sandbox_pool(**kwargs):
+    # Don't leave idle bisect containers running after the worker exits
+    sandboxing.close_container_pool()
+
 if __name__ == "__main__":
     celery_app.start()
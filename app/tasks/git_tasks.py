@@ -1,12 +1,28 @@
 from .celery_app import celery_app
-from ..git_logic import repo_manager
+from ..git_logic import repo_manager, tools
 from ..security import sandboxing
+from .. import schemas
 import logging
 
 # Configure a logger for this module to track task progress
 logger = logging.getLogger(__name__)
 
-@celery_app.task(bind=True)
+# Characters of bisect output kept in a task result (stored in Redis)
+_MAX_RESULT_LOG_CHARS = 64_000
+
+def _truncate(text: str, limit: int = _MAX_RESULT_LOG_CHARS) -> str:
+    """
+    Keeps the head and tail of long output, where bisect prints its setup and result.
+    """
+    if len(text) <= limit:
+        return text
+    return text[:limit // 2] + "\n...[truncated]...\n" + text[-(limit // 2):]
+
+# Bisects run for minutes, so the message is only acked once the task finishes:
+# if the worker dies mid-run, Redis redelivers it instead of losing it.
+# They're routed to their own "bisect" queue (see task_routes) so they don't
+# hold up fetches and repo maps.
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
 def run_bisect_task(self, repo_url: str, test_command: str, bad_commit: str, good_commit: str):
     """
     Celery task to run a git bisect operation in a sandboxed environment.
@@ -31,6 +47,11 @@ def run_bisect_task(self, repo_url: str, test_command: str, bad_commit: str, goo
         self.update_state(state='PROGRESS', meta={'status': 'Cloning/Fetching repository...'})
         repo_path = repo_manager.get_repo(repo_url)
         
+        # The clone is blobless and the sandbox has no network, so download
+        # the file contents for the bisect range up front.
+        self.update_state(state='PROGRESS', meta={'status': 'Fetching file contents for bisect range...'})
+        repo_manager.prefetch_bisect_blobs(repo_path, bad_commit, good_commit)
+        
         # Step 2: Run the secure sandbox
         self.update_state(state='PROGRESS', meta={'status': 'Running bisect in sandbox...'})
         
@@ -48,13 +69,13 @@ def run_bisect_task(self, repo_url: str, test_command: str, bad_commit: str, goo
             return {
                 "status": "completed",
                 "bad_commit": result['found_commit'],
-                "logs": result['logs']
+                "logs": _truncate(result['logs'])
             }
         else:
             return {
                 "status": "failed",
                 "error": "Bisect failed or timed out",
-                "logs": result.get('logs', result.get('error', 'Unknown error'))
+                "logs": _truncate(result.get('logs', result.get('error', 'Unknown error')))
             }
 
     except Exception as e:
@@ -62,4 +83,43 @@ def run_bisect_task(self, repo_url: str, test_command: str, bad_commit: str, goo
         return {
             "status": "error",
             "error": str(e)
-        }
\ No newline at end of file
+        }
+
+@celery_app.task(ignore_result=True)
+def fetch_repo_task(repo_url: str, repo_path: str):
+    """
+    Celery task that refreshes an existing clone in the background.
+    
+    Queued by repo_manager.get_repo when a clone hasn't been fetched within
+    REPO_FETCH_TTL, so API requests never wait on the network for a cache hit.
+    Nothing waits on the result, so it isn't stored.
+    
+    Args:
+        repo_url: Public URL of the git repo.
+        repo_path: Local path of the existing clone.
+    """
+    try:
+        repo_manager.fetch_repo(repo_url, repo_path)
+    except Exception as e:
+        logger.error(f"Background fetch failed for {repo_url}: {e}")
+
+@celery_app.task(track_started=True)
+def build_repo_map_task(repo_url: str, commit_hash: str):
+    """
+    Celery task that builds the repo map for a commit.
+    
+    Queued by the /public/get_repo_map endpoint under a job id derived from
+    the repo and commit, so the stored result is reused by later requests.
+    Failures raise, which the job status reports as FAILURE.
+    
+    Args:
+        repo_url: Public URL of the git repo.
+        commit_hash: Full SHA of the commit to map.
+    """
+    logger.info(f"Building repo map for {repo_url} at {commit_hash}")
+    repo_path = repo_manager.get_repo(repo_url)
+    repo_map = tools.generate_repo_map(repo_path, commit_hash)
+    if repo_map is None:
+        raise RuntimeError(f"Failed to generate repo map for {repo_url} at {commit_hash}")
+    # The result backend stores JSON, so convert the RepoMapItem models
+    return schemas.RepoMapResponse.model_validate(repo_map).model_dump(mode="json")
@@ -0,0 +1,23 @@
+# Gunicorn settings for the API server (Phase 4 deployment)
+# Usage: gunicorn -c gunicorn_conf.py app.main:app
+import multiprocessing
+import os
+
+# Bind to all interfaces so the container port can be published
+bind = os.getenv("BIND", "0.0.0.0:8000")
+
+# One worker per core; override with WEB_CONCURRENCY
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# Uvicorn worker with loop/http set to "auto", which picks uvloop and httptools
+# (both installed by uvicorn[standard]) over asyncio and h11
+worker_class = "uvicorn_worker.UvicornWorker"
+
+# Pending connections the kernel queues while every worker is busy
+backlog = 2048
+
+# Keep idle HTTP/1.1 connections open so clients can reuse them
+keepalive = 30
+
+# Clones of large repos can take a while on a cold request
+timeout = 120